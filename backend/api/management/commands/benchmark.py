@@ -0,0 +1,267 @@
+import json
+import math
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryCounter
+from recipes.models import (Favorites, Ingredient, IngredientsForRecipes,
+                            Recipe, ShoppingCart, Tag)
+from recipes.shopping_list import rebuild_shopping_lists
+from users.models import Subscription, User
+
+# картинка 1x1 для создания рецептов
+PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAA'
+       'ADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+# минимальный объём данных, при котором замеры имеют смысл
+MIN_RECIPES = 100
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def build_dataset():
+    """
+    Дополняет БД данными, без которых сценарии нечего измерять,
+    и создаёт пользователя бенчмарка с подписками, избранным
+    и списком покупок. Вызывается внутри откатываемой транзакции.
+    """
+    tags = list(Tag.objects.all()[:3])
+    if not tags:
+        tags = [
+            Tag.objects.create(
+                name=f'benchmark-{i}', color=f'#00000{i}',
+                slug=f'benchmark-{i}'
+            ) for i in range(3)
+        ]
+    if Ingredient.objects.count() < 50:
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'benchmark-{i}', measurement_unit='г')
+            for i in range(50)
+        ], ignore_conflicts=True)
+    ingredient_ids = list(
+        Ingredient.objects.order_by('pk').values_list('pk', flat=True)[:50]
+    )
+    missing = MIN_RECIPES - Recipe.objects.count()
+    if missing > 0:
+        authors = [
+            User.objects.create(
+                email=f'benchmark-author-{i}@benchmark.local',
+                username=f'benchmark-author-{i}',
+                first_name='Автор', last_name='Бенчмарка'
+            ) for i in range(10)
+        ]
+        Recipe.objects.bulk_create([
+            Recipe(
+                name=f'benchmark-{i}', text='Рецепт для бенчмарка',
+                cooking_time=10 + i % 50, author=authors[i % len(authors)],
+                image='recipes/images/benchmark.png'
+            ) for i in range(missing)
+        ])
+        new_recipes = list(Recipe.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('pk', flat=True))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=pk, tag_id=tags[pk % len(tags)].pk)
+            for pk in new_recipes
+        ])
+        IngredientsForRecipes.objects.bulk_create([
+            IngredientsForRecipes(
+                recipe_id=pk, amount=j + 1,
+                ingredient_id=ingredient_ids[(pk + j) % len(ingredient_ids)]
+            ) for pk in new_recipes for j in range(8)
+        ])
+    user = User.objects.create(
+        email='benchmark@benchmark.local', username='benchmark',
+        first_name='Бенчмарк', last_name='Бенчмарк'
+    )
+    recipes = list(Recipe.objects.order_by('-pub_date', '-pk')[:30])
+    author_ids = list(dict.fromkeys(recipe.author_id for recipe in recipes))
+    Subscription.objects.bulk_create([
+        Subscription(user=user, author_id=author_id)
+        for author_id in author_ids[:10]
+    ])
+    Favorites.objects.bulk_create(
+        [Favorites(user=user, recipe=recipe) for recipe in recipes[:20]]
+    )
+    ShoppingCart.objects.bulk_create(
+        [ShoppingCart(user=user, recipe=recipe) for recipe in recipes[10:]]
+    )
+    rebuild_shopping_lists(user.pk, user.pk)
+    own = Recipe.objects.create(
+        name='benchmark-own', text='Рецепт для бенчмарка', cooking_time=5,
+        author=user, image='recipes/images/benchmark.png'
+    )
+    own.tags.set(tags[:1])
+    IngredientsForRecipes.objects.bulk_create([
+        IngredientsForRecipes(recipe=own, ingredient_id=pk, amount=1)
+        for pk in ingredient_ids[:5]
+    ])
+    prefix = Ingredient.objects.order_by('pk').values_list(
+        'name', flat=True
+    ).first()[:2]
+    return {
+        'token': Token.objects.create(user=user).key,
+        'tag': tags[0].slug,
+        'recipe': recipes[0].pk,
+        'own_recipe': own.pk,
+        'tag_ids': [tag.pk for tag in tags],
+        'ingredient_ids': ingredient_ids,
+        'prefix': prefix,
+    }
+
+
+def recipe_body(data, iteration):
+    return {
+        'tags': data['tag_ids'][:2],
+        'ingredients': [
+            {'id': pk, 'amount': 1 + (iteration + i) % 5}
+            for i, pk in enumerate(data['ingredient_ids'][:10])
+        ],
+        'name': f'benchmark-new-{iteration}',
+        'text': 'Рецепт для бенчмарка',
+        'cooking_time': 15,
+        'image': PNG,
+    }
+
+
+# сценарий: (метод, функция построения адреса и тела запроса)
+SCENARIOS = {
+    'recipe_list': ('get', lambda data, i: ('/api/recipes/?limit=6', None)),
+    'recipe_list_filtered': ('get', lambda data, i: (
+        f'/api/recipes/?tags={data["tag"]}&is_favorited=1&limit=6', None
+    )),
+    'recipe_detail': ('get', lambda data, i: (
+        f'/api/recipes/{data["recipe"]}/', None
+    )),
+    'subscriptions': ('get', lambda data, i: (
+        '/api/users/subscriptions/?recipes_limit=3', None
+    )),
+    'ingredient_autocomplete': ('get', lambda data, i: (
+        '/api/ingredients/?' + urlencode({'name': data['prefix']}), None
+    )),
+    'shopping_cart_download': ('get', lambda data, i: (
+        '/api/recipes/download_shopping_cart/', None
+    )),
+    'recipe_create': ('post', lambda data, i: (
+        '/api/recipes/', recipe_body(data, i)
+    )),
+    'recipe_update': ('patch', lambda data, i: (
+        f'/api/recipes/{data["own_recipe"]}/', recipe_body(data, i)
+    )),
+}
+
+
+class Command(BaseCommand):
+    help = ('Runs benchmark scenarios against the API routes and reports '
+            'latency percentiles, throughput and SQL query counts')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', nargs='+', choices=SCENARIOS, default=list(SCENARIOS)
+        )
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON с результатами предыдущего запуска'
+        )
+
+    def run_scenario(self, client, data, name, iterations, warmup):
+        method, build = SCENARIOS[name]
+        request = getattr(client, method)
+        latencies = []
+        queries = 0
+        for iteration in range(warmup + iterations):
+            url, body = build(data, iteration)
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(counter)
+                    )
+                start = time.perf_counter()
+                response = request(
+                    url, body, content_type='application/json'
+                ) if body is not None else request(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{name}: {url} вернул {response.status_code}'
+                )
+            if iteration >= warmup:
+                latencies.append(elapsed * 1000)
+                queries += counter.queries
+        return {
+            'iterations': iterations,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p90_ms': round(percentile(latencies, 90), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / iterations, 3),
+            'rps': round(iterations * 1000 / sum(latencies), 1),
+            'queries': round(queries / iterations, 2),
+        }
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше 0')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['scenarios']
+        results = {}
+        with TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+            MEDIA_ROOT=media_root
+        ), transaction.atomic():
+            data = build_dataset()
+            client = Client(HTTP_AUTHORIZATION=f'Token {data["token"]}')
+            for name in options['scenario']:
+                results[name] = self.run_scenario(
+                    client, data, name, options['iterations'],
+                    options['warmup']
+                )
+                self.report(name, results[name], previous)
+            transaction.set_rollback(True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'database': connection.vendor,
+                    'recipes': Recipe.objects.count(),
+                    'scenarios': results,
+                }, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+    def report(self, name, result, previous):
+        line = (
+            f'{name:<25} p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p90 {result["p90_ms"]:>8.2f} мс  '
+            f'p99 {result["p99_ms"]:>8.2f} мс  '
+            f'{result["rps"]:>7.1f} запр./с  '
+            f'SQL {result["queries"]:>5.1f}'
+        )
+        if previous and name in previous:
+            before = previous[name]
+            change = (result['p50_ms'] / before['p50_ms'] - 1) * 100
+            line += (
+                f'  (p50 {change:+.1f}%, '
+                f'SQL {result["queries"] - before["queries"]:+.1f})'
+            )
+        self.stdout.write(line)
@@ -0,0 +1,88 @@
+import io
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.v1.renderers import FastJSONParser, FastJSONRenderer, orjson
+from api.v1.serializers import IngredientSerializer, RecipeGetSerializer
+from recipes.models import Ingredient, Recipe
+
+
+def build_payloads(limit):
+    """Данные ответов API: страница рецептов, рецепт и все ингредиенты"""
+    recipes = RecipeGetSerializer(
+        Recipe.objects.with_related().with_user_flags(
+            AnonymousUser()
+        )[:limit], many=True
+    ).data
+    return {
+        'recipe_list': {
+            'count': Recipe.objects.count(), 'next': None,
+            'previous': None, 'results': recipes,
+        },
+        'recipe_detail': recipes[0],
+        'ingredient_list': IngredientSerializer(
+            Ingredient.objects.all(), many=True
+        ).data,
+    }
+
+
+def measure(function, iterations):
+    """Среднее время одного вызова в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000000
+
+
+class Command(BaseCommand):
+    help = ('Compares the stdlib and orjson based JSON renderers and '
+            'parsers on real RecipeGetSerializer payloads')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='количество рецептов на странице списка'
+        )
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson не установлен, сравнивать не с чем')
+        if options['limit'] < 1 or options['iterations'] < 1:
+            raise CommandError('--limit и --iterations должны быть больше 0')
+        if not Recipe.objects.exists():
+            raise CommandError(
+                'В БД нет рецептов, заполните её командой seed_fake_data'
+            )
+        renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+        parser, fast_parser = JSONParser(), FastJSONParser()
+        iterations = options['iterations']
+        self.stdout.write(
+            f'{"Данные":<16} {"Размер, КБ":>10} {"Операция":>9} '
+            f'{"json, мкс":>11} {"orjson, мкс":>12} {"Ускорение":>10}'
+        )
+        for name, data in build_payloads(options['limit']).items():
+            content = renderer.render(data)
+            if fast_renderer.render(data) != content:
+                raise CommandError(f'{name}: ответы рендереров различаются')
+            if fast_parser.parse(io.BytesIO(content)) != parser.parse(
+                io.BytesIO(content)
+            ):
+                raise CommandError(f'{name}: результаты парсеров различаются')
+            for operation, slow, fast in (
+                ('render', lambda: renderer.render(data),
+                 lambda: fast_renderer.render(data)),
+                ('parse', lambda: parser.parse(io.BytesIO(content)),
+                 lambda: fast_parser.parse(io.BytesIO(content))),
+            ):
+                slow_us = measure(slow, iterations)
+                fast_us = measure(fast, iterations)
+                self.stdout.write(
+                    f'{name:<16} {len(content) / 1024:>10.1f} '
+                    f'{operation:>9} {slow_us:>11.1f} {fast_us:>12.1f} '
+                    f'{slow_us / fast_us:>9.1f}x'
+                )
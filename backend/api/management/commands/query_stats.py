@@ -0,0 +1,86 @@
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import BaseCommand, CommandError
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from api.middleware import (QUERY_STATS_METRICS, get_query_stats_cache,
+                            query_stats_key)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def iter_view_names(patterns, namespace=''):
+    """Перебирает полные имена всех именованных маршрутов проекта"""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = namespace
+            if pattern.namespace:
+                prefix = f'{namespace}{pattern.namespace}:'
+            yield from iter_view_names(pattern.url_patterns, prefix)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}{pattern.name}'
+
+
+class Command(BaseCommand):
+    help = ('Shows SQL query statistics per route collected '
+            'by QueryBudgetMiddleware')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true')
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            cache = get_query_stats_cache()
+        except ImproperlyConfigured as exc:
+            raise CommandError(exc)
+        routes = [
+            f'{method} {name}'
+            for name in dict.fromkeys(iter_view_names(
+                get_resolver().url_patterns
+            ))
+            for method in METHODS
+        ]
+        keys = [
+            query_stats_key(route, metric)
+            for route in routes for metric in QUERY_STATS_METRICS
+        ]
+        if options['reset']:
+            cache.delete_many(keys)
+            self.stdout.write(self.style.SUCCESS('Статистика сброшена!'))
+            return
+        values = cache.get_many(keys)
+        stats = []
+        for route in routes:
+            metrics = {
+                metric: values.get(query_stats_key(route, metric), 0)
+                for metric in QUERY_STATS_METRICS
+            }
+            if not metrics['requests']:
+                continue
+            requests = metrics['requests']
+            stats.append({
+                'route': route,
+                'requests': requests,
+                'avg_queries': metrics['queries'] / requests,
+                'avg_db_ms': metrics['db_time_us'] / requests / 1000,
+                'over_budget': metrics['over_budget'],
+            })
+        stats.sort(key=lambda row: row['avg_queries'], reverse=True)
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        if not stats:
+            self.stdout.write('Статистика пока не собрана.')
+            return
+        self.stdout.write(
+            f'{"Маршрут":<50} {"Запросов":>9} {"SQL, ср.":>9} '
+            f'{"БД, мс":>8} {"Сверх бюджета":>14}'
+        )
+        for row in stats:
+            self.stdout.write(
+                f'{row["route"]:<50} {row["requests"]:>9} '
+                f'{row["avg_queries"]:>9.1f} {row["avg_db_ms"]:>8.1f} '
+                f'{row["over_budget"]:>14}'
+            )
@@ -0,0 +1,123 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.constants import (QUERY_BUDGET_DEFAULT,
+                                QUERY_BUDGET_WRITE_DEFAULT,
+                                QUERY_STATS_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+# метрики маршрута, накапливаемые в кеше
+QUERY_STATS_METRICS = ('requests', 'queries', 'db_time_us', 'over_budget')
+
+
+def query_stats_key(route, metric):
+    return 'query_stats:{}:{}'.format(route.replace(' ', ':'), metric)
+
+
+def get_query_stats_cache():
+    """
+    Кеш статистики из настройки QUERY_STATS_CACHE_ALIAS. Кеш в памяти
+    процесса не подходит: команда query_stats работает в отдельном
+    процессе и не увидела бы собранных данных.
+    """
+    stats_cache = caches[settings.QUERY_STATS_CACHE_ALIAS]
+    if isinstance(stats_cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            'Для статистики SQL-запросов нужен кеш, общий для всех '
+            'процессов: QUERY_STATS_CACHE_ALIAS указывает на '
+            f'{type(stats_cache).__name__}.'
+        )
+    return stats_cache
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper, считающая запросы и время их выполнения"""
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы и время БД для каждого запроса к API.
+
+    Запросы, превысившие бюджет маршрута (QUERY_BUDGETS по ключу
+    'МЕТОД имя' или 'имя', по умолчанию QUERY_BUDGET_DEFAULT для
+    чтения и QUERY_BUDGET_WRITE_DEFAULT для изменений), пишутся в лог.
+    При включённой настройке QUERY_STATS ответ получает заголовки
+    X-DB-Queries и Server-Timing, а статистика по маршрутам
+    накапливается в общем кеше QUERY_STATS_CACHE_ALIAS и выводится
+    командой query_stats.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.stats_cache = (
+            get_query_stats_cache() if settings.QUERY_STATS else None
+        )
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        route = f'{request.method} {match.view_name}'
+        if request.method in SAFE_METHODS:
+            default_budget = QUERY_BUDGET_DEFAULT
+        else:
+            default_budget = QUERY_BUDGET_WRITE_DEFAULT
+        budget = settings.QUERY_BUDGETS.get(
+            route, settings.QUERY_BUDGETS.get(
+                match.view_name, default_budget
+            )
+        )
+        over_budget = counter.queries > budget
+        if over_budget:
+            logger.warning(
+                '%s %s: %d SQL-запросов при бюджете %d (%.1f мс)',
+                route, request.get_full_path(), counter.queries, budget,
+                counter.duration * 1000
+            )
+        if self.stats_cache is not None:
+            response['X-DB-Queries'] = counter.queries
+            response['Server-Timing'] = (
+                f'db;dur={counter.duration * 1000:.1f};'
+                f'desc="{counter.queries} queries"'
+            )
+            self.collect(route, {
+                'requests': 1,
+                'queries': counter.queries,
+                'db_time_us': int(counter.duration * 1000000),
+                'over_budget': int(over_budget),
+            })
+        return response
+
+    def collect(self, route, values):
+        for metric, value in values.items():
+            key = query_stats_key(route, metric)
+            self.stats_cache.add(key, 0, QUERY_STATS_TIMEOUT)
+            try:
+                self.stats_cache.incr(key, value)
+            except ValueError:
+                self.stats_cache.set(key, value, QUERY_STATS_TIMEOUT)
@@ -0,0 +1,158 @@
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favorites, FeedEntry, Recipe
+from users.models import User
+from .v1.authentication import TokenCache
+from .v1.serializers import FavAndShopTemplateSerializer
+
+
+@override_settings(TOKEN_CACHE_ALIAS='tokens', CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    },
+})
+class SharedTokenCacheTest(TestCase):
+    """Удаление токена в одном процессе действует во всех остальных"""
+
+    def setUp(self):
+        caches['tokens'].clear()
+        user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        self.token = Token.objects.create(user=user)
+        # кеши двух рабочих процессов с общим кешем Django
+        self.first, self.second = TokenCache(), TokenCache()
+
+    def test_delete_is_seen_by_other_process(self):
+        self.first.set(self.token.key, self.token)
+        self.assertEqual(self.second.get(self.token.key), self.token)
+        self.second.delete(self.token.key)
+        self.assertIsNone(self.first.get(self.token.key))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_process_local_cache_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.first.get(self.token.key)
+
+
+@patch('recipes.models.FEED_FANOUT_FOLLOWERS_LIMIT', 1)
+@patch('recipes.feed.FEED_FANOUT_FOLLOWERS_LIMIT', 1)
+class FeedFanOutThresholdTest(TestCase):
+    """Ленты следуют за переходом автора через порог раскладки"""
+
+    def setUp(self):
+        self.author, self.first, self.second = [
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name='Имя', last_name='Фамилия', password='pass-4815'
+            ) for name in ('author', 'first', 'second')
+        ]
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10,
+            author=self.author, image='recipes/images/recipe.png'
+        )
+
+    def subscribe(self, user, delete=False):
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        response = client.delete(url) if delete else client.post(url)
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_crossing_threshold(self):
+        self.subscribe(self.first)
+        self.assertTrue(FeedEntry.objects.filter(user=self.first).exists())
+        self.subscribe(self.second)
+        self.assertFalse(FeedEntry.objects.exists())
+        recipe = Recipe.objects.create(
+            name='Новый рецепт', text='Описание', cooking_time=10,
+            author=self.author, image='recipes/images/recipe.png'
+        )
+        self.subscribe(self.second, delete=True)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user', 'recipe')),
+            {(self.first.pk, self.recipe.pk), (self.first.pk, recipe.pk)}
+        )
+
+
+class ConditionalGetTest(TestCase):
+    """Ответ 304 несёт те же ETag и Last-Modified, что и 200"""
+
+    def test_not_modified_has_validators(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10,
+            author=author, image='recipes/images/recipe.png'
+        )
+        url = f'/api/recipes/{recipe.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        not_modified = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(
+            not_modified['Last-Modified'], response['Last-Modified']
+        )
+
+
+class BulkEntriesRaceTest(TestCase):
+    """Строки, вставленные или удалённые одновременно другим запросом,
+    не учитываются повторно"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10,
+            author=self.user, image='recipes/images/recipe.png'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_with_state(self, in_list, delete=False):
+        """Запрос пачки с состоянием списка, прочитанным до того,
+        как другой запрос его изменил"""
+        with patch.object(
+            FavAndShopTemplateSerializer, 'get_recipes_state',
+            return_value={self.recipe.pk: in_list}
+        ):
+            method = self.client.delete if delete else self.client.post
+            return method(
+                '/api/recipes/favorite/',
+                {'recipes': [self.recipe.pk]}, format='json'
+            ).json()
+
+    def test_concurrent_insert(self):
+        Favorites.objects.create(user=self.user, recipe=self.recipe)
+        response = self.post_with_state(in_list=False)
+        self.assertEqual(
+            response, [{'id': self.recipe.pk, 'status': 'exists'}]
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_concurrent_delete(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=1)
+        response = self.post_with_state(in_list=True, delete=True)
+        self.assertEqual(
+            response, [{'id': self.recipe.pk, 'status': 'absent'}]
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
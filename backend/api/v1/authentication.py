@@ -0,0 +1,114 @@
+import pickle
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from foodgram.constants import TOKEN_CACHE_SIZE, TOKEN_CACHE_TIMEOUT
+
+
+class TokenCache:
+    """
+    Кеш токенов авторизации вместе с пользователями.
+
+    Если в настройке TOKEN_CACHE_ALIAS задан общий кеш, записи хранятся
+    только в нём, чтобы удаление токена сразу действовало во всех
+    процессах; кеш в памяти процесса для этого не подходит. Иначе
+    используется ограниченный LRU-словарь в памяти процесса с TTL.
+    Записи хранятся сериализованными, поэтому каждый запрос получает
+    собственную копию пользователя.
+    """
+    def __init__(self, size=TOKEN_CACHE_SIZE, timeout=TOKEN_CACHE_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def make_key(key):
+        return 'auth_token:' + sha256(key.encode()).hexdigest()
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'TOKEN_CACHE_ALIAS', None)
+        if not alias:
+            return None
+        shared = caches[alias]
+        if isinstance(shared, (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                'Кеш токенов должен быть общим для всех процессов: '
+                f'TOKEN_CACHE_ALIAS указывает на {type(shared).__name__}.'
+            )
+        return shared
+
+    def get(self, key):
+        cache_key = self.make_key(key)
+        shared = self.shared
+        if shared is not None:
+            data = shared.get(cache_key)
+            return None if data is None else pickle.loads(data)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= time.monotonic():
+                del self.entries[cache_key]
+                return None
+            self.entries.move_to_end(cache_key)
+        return pickle.loads(data)
+
+    def store(self, cache_key, data):
+        with self.lock:
+            self.entries[cache_key] = (time.monotonic() + self.timeout, data)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def set(self, key, token):
+        cache_key = self.make_key(key)
+        data = pickle.dumps(token)
+        shared = self.shared
+        if shared is not None:
+            shared.set(cache_key, data, self.timeout)
+        else:
+            self.store(cache_key, data)
+
+    def delete(self, key):
+        cache_key = self.make_key(key)
+        with self.lock:
+            self.entries.pop(cache_key, None)
+        if self.shared is not None:
+            self.shared.delete(cache_key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, запоминающая найденный токен с пользователем,
+    чтобы не обращаться к БД при каждом запросе. Записи удаляются
+    сигналами при удалении токена и изменении пользователя.
+    """
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        elif not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
@@ -0,0 +1,193 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FormatParamContentNegotiation(DefaultContentNegotiation):
+    """
+    Согласование содержимого без учёта параметра format: в выгрузке
+    списка покупок он задаёт формат файла, а не рендерер ответа.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ShoppingListWriter(ABC):
+    """
+    Базовый класс потоковой записи списка покупок.
+    Принимает итератор строк (название, единица измерения, количество)
+    и отдаёт файл по частям, не собирая его целиком в памяти.
+    """
+    extension = None
+    content_type = None
+
+    def __init__(self, products):
+        self.products = products
+
+    @abstractmethod
+    def __iter__(self):
+        """Части файла (str или bytes) по порядку"""
+
+
+class TextShoppingListWriter(ShoppingListWriter):
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def __iter__(self):
+        yield 'Список продуктов:'
+        for name, measurement_unit, amount in self.products:
+            yield f'\n{name} - {amount} {measurement_unit}'
+
+
+class _Echo:
+    """Псевдобуфер, возвращающий записанную строку вместо её хранения"""
+    def write(self, value):
+        return value
+
+
+class CsvShoppingListWriter(ShoppingListWriter):
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def __iter__(self):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for name, measurement_unit, amount in self.products:
+            yield writer.writerow((name, amount, measurement_unit))
+
+
+class JsonShoppingListWriter(ShoppingListWriter):
+    extension = 'json'
+    content_type = 'application/json'
+
+    def __iter__(self):
+        separator = ''
+        yield '['
+        for name, measurement_unit, amount in self.products:
+            yield separator + json.dumps(
+                {'name': name, 'amount': amount,
+                 'measurement_unit': measurement_unit},
+                ensure_ascii=False
+            )
+            separator = ','
+        yield ']'
+
+
+class PdfShoppingListWriter(ShoppingListWriter):
+    """
+    Минимальный PDF без внешних зависимостей: стандартный шрифт Helvetica
+    с кодировкой cp1251, русские буквы подключаются через массив
+    Differences. Страницы записываются по мере чтения строк,
+    объект со списком страниц и таблица xref - в конце файла.
+    """
+    extension = 'pdf'
+    content_type = 'application/pdf'
+
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 12
+    line_height = 16
+    lines_per_page = (page_height - 2 * margin) // line_height
+
+    def __init__(self, products):
+        super().__init__(products)
+        self.offsets = {}
+        self.position = 0
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        chunk = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        self.position += len(chunk)
+        return chunk
+
+    @staticmethod
+    def _encoding_differences():
+        """Имена глифов Adobe (afii) для русских букв в кодировке cp1251"""
+        glyphs = [b'168 /afii10023', b'184 /afii10071']
+        for code in range(0xC0, 0x100):
+            index = code - (0xC0 if code < 0xE0 else 0xE0)
+            base = 10017 if code < 0xE0 else 10065
+            glyphs.append(b'%d /afii%d' % (code, base + index + (index >= 6)))
+        return b' '.join(glyphs)
+
+    @staticmethod
+    def _escape(text):
+        return text.encode('cp1251', errors='replace').replace(
+            b'\\', b'\\\\'
+        ).replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    def _page(self, number, lines):
+        text = [b'BT /F1 %d Tf %d TL %d %d Td' % (
+            self.font_size, self.line_height, self.margin,
+            self.page_height - self.margin
+        )]
+        text.extend(b'(%s) Tj T*' % self._escape(line) for line in lines)
+        text.append(b'ET')
+        content = b'\n'.join(text)
+        return self._object(number, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+            % (self.page_width, self.page_height, number + 1)
+        )) + self._object(
+            number + 1,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content),
+                                                          content)
+        )
+
+    def _lines(self):
+        yield 'Список продуктов:'
+        for name, measurement_unit, amount in self.products:
+            yield f'{name} - {amount} {measurement_unit}'
+
+    def __iter__(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.position = len(header)
+        yield header
+        yield self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        yield self._object(3, (
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding 4 0 R >>'
+        ))
+        yield self._object(4, (
+            b'<< /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            b'/Differences [%s] >>' % self._encoding_differences()
+        ))
+        pages = []
+        lines = []
+        for line in self._lines():
+            lines.append(line)
+            if len(lines) == self.lines_per_page:
+                pages.append(5 + 2 * len(pages))
+                yield self._page(pages[-1], lines)
+                lines = []
+        if lines or not pages:
+            pages.append(5 + 2 * len(pages))
+            yield self._page(pages[-1], lines)
+        yield self._object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page for page in pages), len(pages)
+        ))
+        xref_position = self.position
+        size = max(self.offsets) + 1
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        xref.extend(
+            b'%010d 00000 n \n' % self.offsets[number]
+            for number in range(1, size)
+        )
+        xref.append(
+            b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (size, xref_position)
+        )
+        yield b''.join(xref)
+
+
+SHOPPING_LIST_WRITERS = {
+    writer.extension: writer for writer in (
+        TextShoppingListWriter, CsvShoppingListWriter,
+        JsonShoppingListWriter, PdfShoppingListWriter,
+    )
+}
@@ -1,8 +1,11 @@
 from django.contrib.auth import get_user_model
-from django_filters import (CharFilter, FilterSet, ModelChoiceFilter,
-                            ModelMultipleChoiceFilter, NumberFilter)
+from django.db.models import Count, Exists, OuterRef
+from django_filters import (CharFilter, ChoiceFilter, FilterSet,
+                            ModelChoiceFilter, ModelMultipleChoiceFilter,
+                            NumberFilter)
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
@@ -20,8 +23,13 @@ class RecipeFilter(FilterSet):
     )
     tags = ModelMultipleChoiceFilter(
         field_name='tags__slug', queryset=Tag.objects.all(),
-        to_field_name='slug'
+        to_field_name='slug', method='filter_tags'
     )
+    tags_match = ChoiceFilter(
+        choices=(('any', 'Любой из тегов'), ('all', 'Все теги')),
+        method='filter_tags_match'
+    )
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -41,6 +49,34 @@ class RecipeFilter(FilterSet):
             )
         return queryset
 
+    def filter_tags(self, queryset, name, tags):
+        """
+        Отбирает рецепты полусоединением с таблицей связей тегов,
+        поэтому рецепт с несколькими выбранными тегами не дублируется.
+        При tags_match=all рецепт должен иметь все выбранные теги.
+        """
+        if not tags:
+            return queryset
+        tag_ids = {tag.pk for tag in tags}
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_match') == 'all':
+            return queryset.filter(pk__in=recipe_tags.values(
+                'recipe_id'
+            ).annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(tag_ids)).values('recipe_id'))
+        return queryset.filter(Exists(
+            recipe_tags.filter(recipe_id=OuterRef('pk'))
+        ))
+
+    def filter_tags_match(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
+
 
 class IngredientFilter(FilterSet):
     name = CharFilter(
@@ -0,0 +1,71 @@
+from abc import ABC, abstractmethod
+from hashlib import md5
+
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin(ABC):
+    """
+    Поддержка условных GET-запросов (ETag / Last-Modified).
+
+    Вьюсет возвращает из get_resource_version() версию ресурса,
+    вычисляемую дешёвым запросом без сериализации. Если клиент прислал
+    совпадающий If-None-Match или If-Modified-Since, ответ 304
+    отдаётся без выполнения самого действия.
+    """
+    conditional_actions = ('retrieve',)
+    resource_etag = None
+    resource_last_modified = None
+
+    @abstractmethod
+    def get_resource_version(self):
+        """
+        Возвращает пару (версия, дата изменения или None)
+        либо None, если ресурс не найден.
+        """
+
+    def get_not_modified_response(self, request):
+        if self.action not in self.conditional_actions:
+            return None
+        version = self.get_resource_version()
+        if version is None:
+            return None
+        key, last_modified = version
+        self.resource_etag = quote_etag(md5(str(key).encode()).hexdigest())
+        if last_modified is not None:
+            self.resource_last_modified = int(last_modified.timestamp())
+        return get_conditional_response(
+            request,
+            etag=self.resource_etag,
+            last_modified=self.resource_last_modified
+        )
+
+    def list(self, request, *args, **kwargs):
+        response = self.get_not_modified_response(request)
+        if response is not None:
+            return response
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.get_not_modified_response(request)
+        if response is not None:
+            return response
+        return super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        # ответ 304 несёт те же валидаторы, что и 200 (RFC 7232, 4.1)
+        if self.resource_etag is not None and response.status_code in (
+            200, 304
+        ):
+            response['ETag'] = self.resource_etag
+            if self.resource_last_modified is not None:
+                response['Last-Modified'] = http_date(
+                    self.resource_last_modified
+                )
+            patch_vary_headers(response, ('Authorization',))
+        return response
@@ -1,6 +1,161 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class PageNumberPaginationWithLimit(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по уникальному набору полей сортировки.
+    Страница выбирается условием на значения ключа последней записи
+    предыдущей страницы, без OFFSET и без подсчёта общего кол-ва,
+    поэтому стоимость запроса не растёт с номером страницы.
+    Набор полей берётся из атрибута вьюсета cursor_ordering.
+    """
+    ordering = ('id',)
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', None) or self.ordering
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param], strict=True
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in ordering
+        )
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            values = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, cursor['values'])
+            ]
+            if len(values) != len(ordering):
+                raise ValueError
+            return values, bool(cursor.get('reverse'))
+        except (BinasciiError, KeyError, TypeError, ValueError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        values = [
+            instance._meta.get_field(field.lstrip('-')).value_to_string(
+                instance
+            )
+            for field in self.ordering_fields
+        ]
+        cursor = b64encode(json.dumps(
+            {'values': values, 'reverse': reverse}
+        ).encode('ascii')).decode('ascii')
+        url = remove_query_param(self.base_url, 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.ordering_fields = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(
+            request, queryset.model, self.ordering_fields
+        )
+        ordering = self.ordering_fields
+        if reverse:
+            ordering = self.reverse_ordering(ordering)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        self.next = (
+            self.encode_cursor(page[-1], False)
+            if page and has_next else None
+        )
+        self.previous = (
+            self.encode_cursor(page[0], True)
+            if page and has_previous else None
+        )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next,
+            'previous': self.previous,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class PageNumberOrKeysetPagination(BasePagination):
+    """
+    Постраничная пагинация с параметрами page и limit, а при наличии
+    в запросе параметра cursor (для первой страницы - пустого) -
+    курсорная пагинация KeysetPagination.
+    """
+    page_number_class = PageNumberPaginationWithLimit
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.paginator = self.keyset_class()
+        else:
+            self.paginator = self.page_number_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_class().get_paginated_response_schema(schema)
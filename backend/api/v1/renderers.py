@@ -0,0 +1,98 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson сериализует dataclass и datetime иначе, чем DRF,
+# поэтому такие объекты передаются в кодировщик DRF
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+) if orjson else 0
+
+# целые длиннее 64 бит orjson читает как float
+INT64_LIMIT = 2 ** 63
+
+
+def has_long_integers(data):
+    """Есть ли в разобранном orjson документе числа за пределами int64"""
+    items = [data]
+    while items:
+        item = items.pop()
+        if type(item) is dict:
+            items.extend(item.values())
+        elif type(item) is list:
+            items.extend(item)
+        elif type(item) is float and abs(item) >= INT64_LIMIT:
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если библиотека установлена.
+
+    Ответ совпадает с ответом JSONRenderer байт в байт, включая
+    порядок полей: orjson используется только в режиме по умолчанию
+    (компактный вывод без отступов и без экранирования не-ASCII
+    символов), объекты, которые он не умеет сериализовать,
+    передаются кодировщику DRF, а при ошибке ответ строит
+    стандартный JSONRenderer. Отличаются только числа с плавающей
+    точкой в экспоненциальной форме и меньше 1e-4 (1e16 вместо 1e+16,
+    значение то же) и NaN с Infinity (null вместо ошибки ValueError);
+    в ответах API таких чисел нет.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact or not self.strict
+                or self.get_indent(
+                    accepted_media_type, renderer_context or {}
+                ) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как и JSONRenderer, экранируем разделители строк для JavaScript
+        return ret.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser на orjson, если библиотека установлена.
+    Документ с целыми числами длиннее 64 бит и некорректный для
+    orjson документ разбираются стандартным модулем json, который
+    возвращает прежний результат или прежнюю ошибку.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if (orjson is None or not self.strict
+                or codecs.lookup(encoding).name != 'utf-8'):
+            return super().parse(stream, media_type, parser_context)
+        data = stream.read()
+        try:
+            result = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+        else:
+            if not has_long_integers(result):
+                return result
+        try:
+            return json.loads(
+                data.decode(encoding), parse_constant=json.strict_constant
+            )
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -1,16 +1,41 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, F, Manager, OuterRef
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from foodgram.constants import BULK_RECIPES_LIMIT
+from recipes.feed import sync_author_fan_out
+from recipes.fragments import get_recipe_fragments
 from recipes.models import (Favorites, Ingredient, IngredientsForRecipes,
-                            Recipe, ShoppingCart, Tag)
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.shopping_list import (add_to_shopping_list,
+                                   change_recipe_in_shopping_lists,
+                                   remove_from_shopping_list)
 from users.models import Subscription
 
 User = get_user_model()
 
 
+def get_subscribed_author_ids(request):
+    """
+    Возвращает множество id авторов, на которых подписан пользователь
+    запроса. Подписки загружаются одним запросом и сохраняются в объекте
+    запроса, поэтому все вложенные сериализаторы используют общий результат.
+    """
+    if not request or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_subscribed_author_ids'):
+        request._subscribed_author_ids = frozenset(
+            Subscription.objects.filter(
+                user=request.user
+            ).values_list('author_id', flat=True)
+        )
+    return request._subscribed_author_ids
+
+
 class UserNewSerializer(UserCreateSerializer):
     """Сериализатор создания пользователя"""
     class Meta:
@@ -31,39 +56,65 @@ class UserGetSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return bool(
-            request
-            and request.user.is_authenticated
-            and obj.subauthor.filter(user=request.user).exists()
+        return obj.pk in get_subscribed_author_ids(
+            self.context.get('request')
         )
 
 
+def get_recipes_limit(request):
+    """Возвращает ограничение на кол-во рецептов из параметра запроса"""
+    rec_limit = request.query_params.get('recipes_limit')
+    return int(rec_limit) if rec_limit else None
+
+
+class SubListSerializer(serializers.ListSerializer):
+    """
+    Загружает рецепты всех авторов страницы подписок одним запросом
+    с учётом параметра recipes_limit.
+    """
+    def to_representation(self, data):
+        authors = list(data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated and authors:
+            author_recipes = {author.pk: [] for author in authors}
+            rec_limit = get_recipes_limit(request)
+            recipes = Recipe.objects.all()
+            if rec_limit is not None:
+                recipes = recipes.limited_per_author(author_recipes, rec_limit)
+            else:
+                recipes = recipes.filter(author_id__in=author_recipes)
+            for recipe in recipes:
+                author_recipes[recipe.author_id].append(recipe)
+            for author in authors:
+                author.limited_recipes = author_recipes[author.pk]
+        return super().to_representation(authors)
+
+
 class SubGetSerializer(UserGetSerializer):
     """Сериализатор отображения подписок пользователя"""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(UserGetSerializer.Meta):
         fields = UserGetSerializer.Meta.fields + ('recipes', 'recipes_count')
+        list_serializer_class = SubListSerializer
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes = obj.recipes.all()
-        rec_limit = request.query_params.get('recipes_limit')
-        if rec_limit:
-            recipes = recipes[:int(rec_limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()
+            rec_limit = get_recipes_limit(request)
+            if rec_limit is not None:
+                recipes = recipes[:rec_limit]
         return SubSmallRecipeSerializer(
             recipes,
             many=True,
             context={'request': request}
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubSmallRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор уменьшенного рецепта для отображения в подписках"""
@@ -94,6 +145,17 @@ class SubPostSerializer(serializers.ModelSerializer):
             )
         return data
 
+    def create(self, validated_data):
+        # счётчик увеличивается до создания подписки: сигнал post_save
+        # решает, раскладывать ли рецепты автора, по новому числу подписчиков
+        with transaction.atomic():
+            User.objects.filter(pk=validated_data['author'].pk).update(
+                followers_count=F('followers_count') + 1
+            )
+            subscription = super().create(validated_data)
+            sync_author_fan_out(subscription.author_id, 1)
+        return subscription
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов"""
@@ -122,8 +184,44 @@ class IngredientsForRecipesSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """
+    Общая для всех пользователей часть рецепта: сериализуется без
+    запроса, поэтому ссылка на картинку относительная, а подписка
+    на автора не заполнена.
+    """
+    tags = TagSerializer(many=True)
+    author = UserGetSerializer(read_only=True)
+    ingredients = IngredientsForRecipesSerializer(
+        source='ingredient_for_recipe',
+        many=True,
+        read_only=True
+    )
+    image = Base64ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
+                  'text', 'cooking_time')
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Собирает представления всех рецептов страницы одним обращением к кешу"""
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        return self.child.represent(recipes)
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
-    """Сериализатор получения рецепта"""
+    """
+    Сериализатор получения рецепта.
+
+    Общая часть представления берётся из кеша (см. get_recipe_fragments),
+    а флаги избранного, списка покупок и подписки на автора
+    подставляются для пользователя запроса. Для флагов рецепты
+    аннотируются методом with_user_flags, подписки загружаются
+    одним запросом в get_subscribed_author_ids.
+    """
     tags = TagSerializer(many=True)
     author = UserGetSerializer(read_only=True)
     ingredients = IngredientsForRecipesSerializer(
@@ -140,8 +238,59 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
                   'is_in_shopping_cart', 'name', 'image',
                   'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        representation = self.represent([instance])
+        if not representation:
+            return super().to_representation(instance)
+        return representation[0]
+
+    def represent(self, recipes):
+        """Представления рецептов; удалённые во время запроса пропускаются"""
+        fragments = get_recipe_fragments(recipes, self.build_fragments)
+        return [
+            self.overlay(fragments[recipe.pk], recipe)
+            for recipe in recipes if recipe.pk in fragments
+        ]
+
+    @staticmethod
+    def build_fragments(recipes):
+        """
+        Строит общие части рецептов, загружая связанные данные,
+        если рецепты получены без with_related()
+        """
+        if not all(
+            hasattr(recipe, '_prefetched_objects_cache') for recipe in recipes
+        ):
+            recipes = list(Recipe.objects.with_related().filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ))
+        return {
+            recipe.pk: (recipe.updated_at, fragment)
+            for recipe, fragment in zip(recipes, RecipeFragmentSerializer(
+                recipes, many=True
+            ).data)
+        }
+
+    def overlay(self, fragment, recipe):
+        """Дополняет общую часть рецепта данными пользователя запроса"""
+        request = self.context.get('request')
+        data = dict(fragment)
+        data['author'] = dict(
+            fragment['author'], is_subscribed=recipe.author_id in (
+                get_subscribed_author_ids(request)
+            )
+        )
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        if data['image'] and request is not None:
+            data['image'] = request.build_absolute_uri(data['image'])
+        return {field: data[field] for field in self.Meta.fields}
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return bool(
             request
@@ -150,6 +299,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return bool(
             request
@@ -163,10 +314,7 @@ class AmountSerializer(serializers.ModelSerializer):
     Сериализатор кол-ва ингредиентов в рецепте, при
     изменении или создании рецепта
     """
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientsForRecipes
@@ -175,10 +323,7 @@ class AmountSerializer(serializers.ModelSerializer):
 
 class RecipePostPatchDeleteSerializer(serializers.ModelSerializer):
     """Сериализатор создания/изменения/удаления рецепта"""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     author = UserGetSerializer(read_only=True)
     ingredients = AmountSerializer(many=True)
     image = Base64ImageField(required=True)
@@ -205,7 +350,7 @@ class RecipePostPatchDeleteSerializer(serializers.ModelSerializer):
                 {'ingredients': 'Пожалуйста добавьте ингредиенты!'}
             )
         ingredient_ids = [
-            ingredient['ingredient'].id for ingredient in ingredients
+            ingredient['ingredient_id'] for ingredient in ingredients
         ]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError(
@@ -215,26 +360,116 @@ class RecipePostPatchDeleteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'image': 'Пожалуйста добавьте картинку к рецепту!'}
             )
+        errors = {}
+        missing_tags = self.get_missing_ids(Tag, tags)
+        if missing_tags:
+            errors['tags'] = f'Теги не найдены: {missing_tags}.'
+        missing_ingredients = self.get_missing_ids(Ingredient, ingredient_ids)
+        if missing_ingredients:
+            errors['ingredients'] = (
+                f'Ингредиенты не найдены: {missing_ingredients}.'
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
+    @staticmethod
+    def get_missing_ids(model, ids):
+        """
+        Проверяет все id одним запросом IN и возвращает
+        строку с отсутствующими в БД id (пустую, если все найдены).
+        """
+        found = set(
+            model.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+        return ', '.join(str(pk) for pk in ids if pk not in found)
+
     def create_bulk_ingredients(self, recipe, ingredients):
         IngredientsForRecipes.objects.bulk_create(
             [IngredientsForRecipes(
-                ingredient_id=ingredient['ingredient'].id,
+                ingredient_id=ingredient['ingredient_id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    def update_tags(self, recipe, tags):
+        """
+        Приводит теги рецепта к переданному списку напрямую через таблицу
+        связей: в отличие от tags.set() не вызывает сигналы m2m_changed,
+        ведь рецепт и так сохраняется в той же транзакции.
+        """
+        existing = set(recipe.tags.values_list('pk', flat=True))
+        removed = existing - set(tags)
+        if removed:
+            Recipe.tags.through.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for tag_id in tags if tag_id not in existing
+        ])
+
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к переданному списку: удаляет
+        лишние строки, меняет изменившиеся кол-ва и добавляет новые,
+        не трогая совпадающие.
+        """
+        amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {
+            row.ingredient_id: row
+            for row in IngredientsForRecipes.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            IngredientsForRecipes.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientsForRecipes.objects.bulk_update(changed, ['amount'])
+        self.create_bulk_ingredients(recipe=recipe, ingredients=[
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient_id'] not in existing
+        ])
+        # разница кол-в для списков покупок, в которые добавлен рецепт:
+        # удаление через QuerySet, bulk_update и bulk_create минуют
+        # delete() и сигналы модели
+        deltas = {
+            ingredient_id: amount - old_amounts.get(ingredient_id, 0)
+            for ingredient_id, amount in amounts.items()
+        }
+        deltas.update(
+            (ingredient_id, -old_amounts[ingredient_id])
+            for ingredient_id in removed
+        )
+        change_recipe_in_shopping_lists(recipe.pk, deltas)
+
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user,
-            **validated_data
-        )
-        recipe.tags.set(tags)
-        self.create_bulk_ingredients(recipe=recipe, ingredients=ingredients)
+        author = self.context['request'].user
+        with transaction.atomic():
+            recipe = Recipe.objects.create(author=author, **validated_data)
+            self.update_tags(recipe=recipe, tags=tags)
+            self.create_bulk_ingredients(
+                recipe=recipe, ingredients=ingredients
+            )
+            User.objects.filter(pk=author.pk).update(
+                recipes_count=F('recipes_count') + 1
+            )
         return recipe
 
     def update(self, instance, validated_data):
@@ -244,19 +479,24 @@ class RecipePostPatchDeleteSerializer(serializers.ModelSerializer):
             )
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_bulk_ingredients(recipe=instance, ingredients=ingredients)
-        return super().update(instance, validated_data)
+        with transaction.atomic():
+            self.update_tags(recipe=instance, tags=tags)
+            self.update_ingredients(recipe=instance, ingredients=ingredients)
+            return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
         return RecipeGetSerializer(instance,
                                    context=context).data
 
 
 class FavAndShopTemplateSerializer(serializers.ModelSerializer):
+    counter_field = None
+
     class Meta:
         fields = ('id', 'user', 'recipe')
 
@@ -269,6 +509,24 @@ class FavAndShopTemplateSerializer(serializers.ModelSerializer):
             )
         return data
 
+    def create(self, validated_data):
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            Recipe.objects.filter(pk=instance.recipe_id).update(
+                **{self.counter_field: F(self.counter_field) + 1}
+            )
+        return instance
+
+    @staticmethod
+    def recipes_added(user_id, recipe_ids):
+        """Вызывается в транзакции после добавления рецептов в список
+        через bulk_create, которое не отправляет сигналы post_save"""
+
+    @staticmethod
+    def recipes_removed(user_id, recipe_ids):
+        """Вызывается в транзакции после удаления рецептов из списка
+        через QuerySet, удаление которым минует delete() модели"""
+
     @staticmethod
     def create_entry(serializer_class, pk, request):
         data = {'user': request.user.pk, 'recipe': pk}
@@ -277,6 +535,88 @@ class FavAndShopTemplateSerializer(serializers.ModelSerializer):
         instance = serializer.save()
         return serializer_class(instance, context={'request': request}).data
 
+    @staticmethod
+    def delete_entry(serializer_class, recipe, user):
+        counter_field = serializer_class.counter_field
+        with transaction.atomic():
+            deleted, _ = serializer_class.Meta.model.objects.filter(
+                recipe=recipe, user=user
+            ).delete()
+            if deleted:
+                Recipe.objects.filter(
+                    pk=recipe.pk, **{f'{counter_field}__gt': 0}
+                ).update(**{counter_field: F(counter_field) - 1})
+                serializer_class.recipes_removed(user.pk, [recipe.pk])
+        return bool(deleted)
+
+    @staticmethod
+    def get_recipes_state(serializer_class, recipe_ids, user):
+        """
+        Одним запросом проверяет существование рецептов и их наличие
+        в списке пользователя: {id рецепта: рецепт уже в списке}.
+        """
+        return dict(Recipe.objects.filter(pk__in=recipe_ids).annotate(
+            in_list=Exists(serializer_class.Meta.model.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        ).values_list('pk', 'in_list'))
+
+    @staticmethod
+    def bulk_create_entries(serializer_class, recipe_ids, user):
+        """
+        Добавляет в список пачку рецептов одной вставкой.
+        Счётчики и статусы считаются по действительно вставленным строкам.
+        Возвращает результат для каждого id: created, exists или not_found.
+        """
+        model = serializer_class.Meta.model
+        counter_field = serializer_class.counter_field
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        with transaction.atomic():
+            state = serializer_class.get_recipes_state(
+                serializer_class, recipe_ids, user
+            )
+            created = set(model.objects.add_for_user(user.pk, [
+                pk for pk, in_list in state.items() if not in_list
+            ]))
+            Recipe.objects.filter(pk__in=created).update(
+                **{counter_field: F(counter_field) + 1}
+            )
+            serializer_class.recipes_added(user.pk, list(created))
+        return [
+            {'id': pk, 'status': (
+                'not_found' if pk not in state
+                else 'created' if pk in created else 'exists'
+            )} for pk in recipe_ids
+        ]
+
+    @staticmethod
+    def bulk_delete_entries(serializer_class, recipe_ids, user):
+        """
+        Удаляет из списка пачку рецептов одним запросом.
+        Счётчики и статусы считаются по действительно удалённым строкам.
+        Возвращает результат для каждого id: deleted, absent или not_found.
+        """
+        model = serializer_class.Meta.model
+        counter_field = serializer_class.counter_field
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        with transaction.atomic():
+            state = serializer_class.get_recipes_state(
+                serializer_class, recipe_ids, user
+            )
+            deleted = set(model.objects.remove_for_user(user.pk, [
+                pk for pk, in_list in state.items() if in_list
+            ]))
+            Recipe.objects.filter(
+                pk__in=deleted, **{f'{counter_field}__gt': 0}
+            ).update(**{counter_field: F(counter_field) - 1})
+            serializer_class.recipes_removed(user.pk, list(deleted))
+        return [
+            {'id': pk, 'status': (
+                'not_found' if pk not in state
+                else 'deleted' if pk in deleted else 'absent'
+            )} for pk in recipe_ids
+        ]
+
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
@@ -288,11 +628,45 @@ class FavAndShopTemplateSerializer(serializers.ModelSerializer):
 
 class FavoritesSerializer(FavAndShopTemplateSerializer):
     """Сериализатор избранного"""
+    counter_field = 'favorites_count'
+
     class Meta(FavAndShopTemplateSerializer.Meta):
         model = Favorites
 
 
 class ShopCartSerializer(FavAndShopTemplateSerializer):
     """Сериализатор списка покупок"""
+    counter_field = 'in_carts_count'
+
     class Meta(FavAndShopTemplateSerializer.Meta):
         model = ShoppingCart
+
+    @staticmethod
+    def recipes_added(user_id, recipe_ids):
+        add_to_shopping_list(user_id, recipe_ids)
+
+    @staticmethod
+    def recipes_removed(user_id, recipe_ids):
+        remove_from_shopping_list(user_id, recipe_ids)
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Сериализатор суммарного кол-ва продукта в списке покупок"""
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для массовых действий"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT
+    )
@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -10,29 +11,75 @@ from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from recipes.models import (Favorites, Ingredient, IngredientsForRecipes,
-                            Recipe, ShoppingCart, Tag)
+from foodgram.constants import (INGREDIENT_SEARCH_RESULTS_LIMIT,
+                                SHOPPING_LIST_CHUNK_SIZE)
+from recipes.catalog import get_catalog_version, get_or_set_catalog_payload
+from recipes.feed import sync_author_fan_out
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient, Recipe, ShoppingListItem, Tag
 from users.models import Subscription
+from .exporters import SHOPPING_LIST_WRITERS, FormatParamContentNegotiation
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageNumberPaginationWithLimit
+from .mixins import ConditionalGetMixin
+from .pagination import KeysetPagination, PageNumberOrKeysetPagination
 from .permissions import (CustomUserPermissions,
                           IsAuthorOrAuthenticatedOrReadOnly)
-from .serializers import (FavoritesSerializer, IngredientSerializer,
-                          RecipeGetSerializer, RecipePostPatchDeleteSerializer,
-                          ShopCartSerializer, SubGetSerializer,
+from .serializers import (BulkRecipesSerializer, FavoritesSerializer,
+                          IngredientSerializer, RecipeGetSerializer,
+                          RecipePostPatchDeleteSerializer, ShopCartSerializer,
+                          ShoppingListItemSerializer, SubGetSerializer,
                           SubPostSerializer, TagSerializer, UserGetSerializer)
 
 User = get_user_model()
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class CatalogCacheMixin:
+    """
+    Отдаёт список и отдельные записи справочника из кеша.
+    Кеш сбрасывается сигналами при любом изменении модели справочника.
+    """
+    def list(self, request, *args, **kwargs):
+        return Response(get_or_set_catalog_payload(
+            self.queryset.model, 'list',
+            lambda: list(super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs
+            ).data)
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        return Response(get_or_set_catalog_payload(
+            self.queryset.model, f'detail:{pk}',
+            lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            ).data
+        ))
+
+
+class CatalogConditionalGetMixin(ConditionalGetMixin):
+    """Версия ответа справочника - версия его кеша и параметры запроса"""
+    conditional_actions = ('list', 'retrieve')
+
+    def get_resource_version(self):
+        return (
+            get_catalog_version(self.queryset.model),
+            self.kwargs.get(self.lookup_field),
+            self.request.query_params.get('name'),
+        ), None
+
+
+class TagViewSet(CatalogConditionalGetMixin, CatalogCacheMixin,
+                 ReadOnlyModelViewSet):
     """Вьюсет для тегов"""
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogConditionalGetMixin, CatalogCacheMixin,
+                        ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов"""
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
@@ -40,20 +87,105 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            response = self.get_not_modified_response(request)
+            if response is not None:
+                return response
+            return Response(ingredient_index.search(
+                name, INGREDIENT_SEARCH_RESULTS_LIMIT
+            ))
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, ModelViewSet):
     """Вьюсет для рецептов"""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAuthenticatedOrReadOnly,)
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
-    pagination_class = PageNumberPaginationWithLimit
+    pagination_class = PageNumberOrKeysetPagination
+    cursor_ordering = ('pub_date', 'id')
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            # связанные данные загружает RecipeGetSerializer
+            # только для рецептов, которых нет в кеше
+            return Recipe.objects.with_user_flags(self.request.user)
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
         return RecipePostPatchDeleteSerializer
 
+    def get_resource_version(self):
+        user = self.request.user
+        try:
+            version = Recipe.objects.filter(
+                pk=self.kwargs['pk']
+            ).with_user_flags(user).annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user_id=user.pk, author_id=OuterRef('author_id')
+                )
+            )).values_list(
+                'updated_at', 'is_favorited', 'is_in_shopping_cart',
+                'is_subscribed'
+            ).first()
+        except ValueError:
+            return None
+        if version is None:
+            return None
+        last_modified = None if user.is_authenticated else version[0]
+        return version, last_modified
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            User.objects.filter(
+                pk=instance.author_id, recipes_count__gt=0
+            ).update(recipes_count=F('recipes_count') - 1)
+
+    @staticmethod
+    def bulk_entries(serializer_class, request, delete=False):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if delete:
+            method = serializer_class.bulk_delete_entries
+        else:
+            method = serializer_class.bulk_create_entries
+        return Response(method(
+            serializer_class, serializer.validated_data['recipes'],
+            request.user
+        ))
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='favorite',
+        permission_classes=[IsAuthenticated]
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_entries(FavoritesSerializer, request)
+
+    @bulk_favorite.mapping.delete
+    def bulk_delete_favorite(self, request):
+        return self.bulk_entries(FavoritesSerializer, request, delete=True)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart',
+        permission_classes=[IsAuthenticated]
+    )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_entries(ShopCartSerializer, request)
+
+    @bulk_shopping_cart.mapping.delete
+    def bulk_delete_shopping_cart(self, request):
+        return self.bulk_entries(ShopCartSerializer, request, delete=True)
+
     @action(
         detail=True,
         methods=['post'],
@@ -66,10 +198,9 @@ class RecipeViewSet(ModelViewSet):
     @favorite.mapping.delete
     def delete_favorite(self, request, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
-        deleted, _ = Favorites.objects.filter(
-            recipe=recipe, user=request.user
-        ).delete()
-        if not deleted:
+        if not FavoritesSerializer.delete_entry(
+            FavoritesSerializer, recipe, request.user
+        ):
             return Response(
                 {'error': 'Рецепт не найден в избранном.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -88,52 +219,96 @@ class RecipeViewSet(ModelViewSet):
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk=None):
         recipe = get_object_or_404(Recipe, pk=pk)
-        deleted, _ = ShoppingCart.objects.filter(
-            recipe=recipe, user=request.user
-        ).delete()
-        if not deleted:
+        if not ShopCartSerializer.delete_entry(
+            ShopCartSerializer, recipe, request.user
+        ):
             return Response(
                 {'error': 'Рецепт не найден в списке покупок.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @staticmethod
-    def get_product_list(ingredients):
-        list_of_products = [
-            f'{ingredient["ingredient__name"]} - '
-            f'{ingredient["total_amount"]} '
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ]
-        list_of_products.insert(0, 'Список продуктов:')
-        return list_of_products
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        pagination_class=KeysetPagination,
+        cursor_ordering=('-pub_date', '-id')
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(
+            self.get_queryset().in_feed_of(request.user)
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
+    def shopping_list(self, request):
+        """Суммарные кол-ва продуктов в списке покупок пользователя"""
+        return Response(ShoppingListItemSerializer(
+            ShoppingListItem.objects.filter(
+                user=request.user
+            ).select_related('ingredient').order_by('ingredient__name'),
+            many=True
+        ).data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=FormatParamContentNegotiation)
     def download_shopping_cart(self, request):
-        ingredients = IngredientsForRecipes.objects.filter(
-            recipe__add_shoppingcart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount')).order_by('ingredient__name')
-
-        list_of_products = self.get_product_list(ingredients)
-        file = 'list_of_products.txt'
-        response = HttpResponse(
-            '\n'.join(list_of_products), content_type='text/plain'
+        file_format = request.query_params.get('format', 'txt')
+        writer_class = SHOPPING_LIST_WRITERS.get(file_format)
+        if writer_class is None:
+            return Response(
+                {'format': 'Доступные форматы: '
+                           f'{", ".join(SHOPPING_LIST_WRITERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        products = ShoppingListItem.objects.filter(
+            user=request.user
+        ).order_by('ingredient__name').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        writer = writer_class(products)
+        response = StreamingHttpResponse(
+            writer, content_type=writer.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="list_of_products.{writer.extension}"'
         )
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
         return response
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(ConditionalGetMixin, UserViewSet):
     """Вьюсет для пользователя"""
     queryset = User.objects.all()
-    pagination_class = PageNumberPaginationWithLimit
+    pagination_class = PageNumberOrKeysetPagination
+    cursor_ordering = ('username', 'id')
+    conditional_actions = ('retrieve', 'me')
     serializer_class = UserGetSerializer
     permission_classes = [CustomUserPermissions]
 
+    def get_resource_version(self):
+        user = self.request.user
+        if self.action == 'me':
+            pk = user.pk
+        else:
+            pk = self.kwargs[self.lookup_field]
+        try:
+            version = User.objects.filter(pk=pk).annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user_id=user.pk, author=OuterRef('pk')
+                ))
+            ).values_list(
+                'email', 'username', 'first_name', 'last_name', 'is_subscribed'
+            ).first()
+        except ValueError:
+            return None
+        if version is None:
+            return None
+        return version, None
+
     @action(detail=False,
             permission_classes=[IsAuthenticated],
             methods=['get'])
@@ -172,9 +347,15 @@ class UsersViewSet(UserViewSet):
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id=None):
         author = get_object_or_404(User, pk=id)
-        deleted, _ = Subscription.objects.filter(
-            user=request.user, author=author
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user, author=author
+            ).delete()
+            if deleted:
+                User.objects.filter(
+                    pk=author.pk, followers_count__gt=0
+                ).update(followers_count=F('followers_count') - 1)
+                sync_author_fan_out(author.pk, -1)
         if not deleted:
             return Response(
                 {'error': 'Вы не подписаны на данного пользователя.'},
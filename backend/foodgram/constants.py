@@ -15,3 +15,46 @@ MIN_VALUE_FOR_AMOUNT_OR_TIME = 1
 
 # максимальное время приготовления или кол-во ингредиента
 MAX_VALUE_FOR_AMOUNT_OR_TIME = 32000
+
+# максимальное кол-во ингредиентов в ответе автодополнения
+INGREDIENT_SEARCH_RESULTS_LIMIT = 50
+
+# время хранения данных справочников тегов и ингредиентов в кеше (сек.)
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# время хранения общей для всех пользователей части представления
+# рецепта в кеше (сек.)
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# кол-во строк, читаемых из БД за раз при выгрузке списка покупок
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+# максимальное кол-во рецептов, хранимых в ленте подписок пользователя
+FEED_MAX_LENGTH = 1000
+
+# кол-во подписчиков, начиная с которого рецепты автора не раскладываются
+# по лентам подписчиков, а подмешиваются в ленту при чтении
+FEED_FANOUT_FOLLOWERS_LIMIT = 10000
+
+# размер пачки записей ленты при массовой вставке
+FEED_BATCH_SIZE = 1000
+
+# максимальное кол-во рецептов в одном запросе массового добавления
+# в избранное или список покупок
+BULK_RECIPES_LIMIT = 100
+
+# максимальное кол-во токенов авторизации в кеше процесса
+TOKEN_CACHE_SIZE = 10000
+
+# время хранения токена авторизации в кеше (сек.); без общего кеша
+# (TOKEN_CACHE_ALIAS) столько удалённый токен действует в других процессах
+TOKEN_CACHE_TIMEOUT = 60
+
+# допустимое кол-во SQL-запросов на один читающий (GET, HEAD, OPTIONS)
+# и изменяющий запрос к API, если для маршрута не задан свой бюджет
+# в настройке QUERY_BUDGETS
+QUERY_BUDGET_DEFAULT = 20
+QUERY_BUDGET_WRITE_DEFAULT = 30
+
+# время хранения накопленной статистики SQL-запросов по маршрутам (сек.)
+QUERY_STATS_TIMEOUT = 60 * 60 * 24 * 7
@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -90,6 +91,24 @@ else:
     }
 
 
+# версии справочников должны видеть все процессы gunicorn, поэтому
+# в docker-compose используется memcached (см. .env.example); кеш в памяти
+# процесса по умолчанию подходит только для разработки в одном процессе
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+# кеш для токенов авторизации, общий для всех процессов (необязательно);
+# задаётся только для общего кеша вроде memcached: кеш в памяти процесса
+# отклоняется, иначе отозванный токен действовал бы в других процессах
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,7 +165,18 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.v1.authentication.CachedTokenAuthentication',
+    ],
+
+    # orjson, если установлен, иначе стандартный модуль json
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.v1.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.v1.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',  # noqa
@@ -156,6 +186,31 @@ REST_FRAMEWORK = {
 }
 
 
+# Учёт SQL-запросов: заголовки ответа и статистика по маршрутам
+
+QUERY_STATS = os.getenv('QUERY_STATS', 'False') == 'True'
+
+# кеш для статистики; должен быть общим для всех процессов (Redis,
+# Memcached, БД или файлы), чтобы команда query_stats её видела
+QUERY_STATS_CACHE_ALIAS = os.getenv('QUERY_STATS_CACHE_ALIAS', 'default')
+
+# бюджеты SQL-запросов для отдельных маршрутов
+# ('МЕТОД имя маршрута' или 'имя маршрута' для всех методов: кол-во)
+QUERY_BUDGETS = {
+    # создание и изменение рецепта: теги, ингредиенты, счётчики,
+    # списки покупок и ответ с полным рецептом
+    'POST api:recipes-list': 25,
+    'PATCH api:recipes-detail': 25,
+    'PUT api:recipes-detail': 25,
+    'GET api:recipes-list': 10,
+    'GET api:recipes-detail': 10,
+    'GET api:recipes-feed': 10,
+    'GET api:users-subscriptions': 10,
+    'api:tags-list': 5,
+    'api:ingredients-list': 5,
+}
+
+
 # DJOSER
 
 DJOSER = {
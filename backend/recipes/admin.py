@@ -23,7 +23,7 @@ class RecipeAdmin(admin.ModelAdmin):
         IngredientsForRecipesInline, FavoritesInline, ShoppingCartInline
     ]
     list_display = ('pk', 'author', 'name', 'text', 'cooking_time',
-                    'pub_date')
+                    'pub_date', 'favorites_count', 'in_carts_count')
     search_fields = ('author', 'name', 'tags')
     list_filter = ('author', 'name', 'tags')
     empty_value_display = 'N/A'
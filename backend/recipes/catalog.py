@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+
+from foodgram.constants import CATALOG_CACHE_TIMEOUT
+
+
+def _version_key(model):
+    return f'catalog:{model._meta.label_lower}:version'
+
+
+def get_catalog_version(model):
+    """
+    Возвращает текущую версию справочника (тегов или ингредиентов).
+    Начальное значение берётся из времени, чтобы после вытеснения ключа
+    из кеша версия не совпала с одной из прежних.
+    """
+    version = cache.get(_version_key(model))
+    if version is None:
+        cache.add(_version_key(model), time.time_ns(), None)
+        version = cache.get(_version_key(model))
+    return version
+
+
+def bump_catalog_version(model):
+    """Увеличивает версию справочника, делая устаревшими его данные в кеше"""
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.set(_version_key(model), time.time_ns(), None)
+
+
+def get_or_set_catalog_payload(model, name, producer):
+    """
+    Возвращает сохранённые для текущей версии справочника данные,
+    а при их отсутствии вычисляет их функцией producer и сохраняет в кеш.
+    """
+    return cache.get_or_set(
+        f'catalog:{model._meta.label_lower}:{name}',
+        producer,
+        CATALOG_CACHE_TIMEOUT,
+        version=get_catalog_version(model)
+    )
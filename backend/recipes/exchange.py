@@ -0,0 +1,43 @@
+from datetime import datetime
+from operator import attrgetter
+
+# поля автора и тега, по которым они переносятся вместе с рецептом;
+# при импорте автор ищется по email, тег - по слагу
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+TAG_FIELDS = ('name', 'color', 'slug')
+
+
+def recipe_to_record(recipe):
+    """
+    Запись рецепта для выгрузки в JSON Lines: автор, теги и ингредиенты
+    хранятся в ней целиком (ингредиенты - в порядке добавления),
+    картинка - ссылкой на файл в хранилище.
+    Рецепт должен быть загружен через Recipe.objects.with_related().
+    """
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': recipe.image.name,
+        'author': {
+            field: getattr(recipe.author, field) for field in AUTHOR_FIELDS
+        },
+        'tags': [
+            {field: getattr(tag, field) for field in TAG_FIELDS}
+            for tag in recipe.tags.all()
+        ],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            } for item in sorted(
+                recipe.ingredient_for_recipe.all(), key=attrgetter('pk')
+            )
+        ],
+    }
+
+
+def parse_pub_date(value):
+    return datetime.fromisoformat(value) if value else None
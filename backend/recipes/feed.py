@@ -0,0 +1,155 @@
+from itertools import islice
+
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.constants import (FEED_BATCH_SIZE, FEED_FANOUT_FOLLOWERS_LIMIT,
+                                FEED_MAX_LENGTH)
+from users.models import Subscription, User
+from .models import FeedEntry, Recipe
+
+
+def is_fanned_out(author_id):
+    """Раскладываются ли рецепты автора по лентам подписчиков"""
+    return User.objects.filter(
+        pk=author_id, followers_count__lte=FEED_FANOUT_FOLLOWERS_LIMIT
+    ).exists()
+
+
+def trim_feeds(user_ids):
+    """Оставляет в лентах пользователей не более FEED_MAX_LENGTH рецептов"""
+    FeedEntry.objects.filter(
+        user_id__in=user_ids,
+        recipe_id__lt=Subquery(
+            FeedEntry.objects.filter(
+                user_id=OuterRef('user_id')
+            ).order_by('-recipe_id').values('recipe_id')[
+                FEED_MAX_LENGTH - 1:FEED_MAX_LENGTH
+            ]
+        )
+    ).delete()
+
+
+def fan_out_recipe(recipe):
+    """
+    Добавляет новый рецепт в ленты всех подписчиков автора.
+    Рецепты популярных авторов не раскладываются: они подмешиваются
+    в ленту при чтении (см. RecipeQuerySet.in_feed_of).
+    """
+    if not is_fanned_out(recipe.author_id):
+        return
+    follower_ids = Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True).iterator()
+    while True:
+        batch = list(islice(follower_ids, FEED_BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, recipe=recipe) for user_id in batch],
+            ignore_conflicts=True
+        )
+        trim_feeds(batch)
+
+
+def add_author_to_feed(user_id, author_id):
+    """Добавляет последние рецепты автора в ленту нового подписчика"""
+    if not is_fanned_out(author_id):
+        return
+    recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pk'
+    ).values_list('pk', flat=True)[:FEED_MAX_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=pk) for pk in recipe_ids],
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim_feeds([user_id])
+
+
+def remove_author_from_feed(user_id, author_id):
+    """Убирает рецепты автора из ленты отписавшегося пользователя"""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def _insert_entries(entries):
+    """
+    Вставляет в ленты пары (пользователь, рецепт) одним INSERT ... SELECT,
+    пропуская уже имеющиеся. Запрос entries содержит WHERE: без него
+    SQLite не разбирает ON CONFLICT после SELECT.
+    """
+    sql, params = entries.values_list(
+        'user_id', 'author__recipes__pk'
+    ).order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FeedEntry._meta.db_table} (user_id, recipe_id) '
+            f'{sql} ON CONFLICT DO NOTHING', params
+        )
+
+
+def fan_out_recipes(recipe_ids):
+    """
+    Раскладывает пачку новых рецептов (например, созданных через
+    bulk_create, без сигнала post_save) по лентам подписчиков авторов.
+    """
+    subscriptions = Subscription.objects.filter(
+        author__recipes__pk__in=recipe_ids
+    )
+    _insert_entries(subscriptions.filter(
+        author__followers_count__lte=FEED_FANOUT_FOLLOWERS_LIMIT
+    ))
+    trim_feeds(subscriptions.values('user_id'))
+
+
+def sync_author_fan_out(author_id, followers_delta):
+    """
+    Вызывается после изменения счётчика подписчиков автора на
+    followers_delta (+1 или -1). Если число подписчиков перешло порог
+    раскладки, приводит ленты всех подписчиков к новому способу:
+    рецепты ставшего популярным автора убираются из лент (они
+    подмешиваются при чтении), рецепты автора, опустившегося до порога,
+    раскладываются заново.
+    """
+    crossed = FEED_FANOUT_FOLLOWERS_LIMIT + (followers_delta > 0)
+    if not User.objects.filter(
+        pk=author_id, followers_count=crossed
+    ).exists():
+        return
+    if followers_delta > 0:
+        FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+        return
+    oldest_in_feed = Recipe.objects.filter(
+        author_id=author_id
+    ).order_by('-pk').values('pk')[FEED_MAX_LENGTH - 1:FEED_MAX_LENGTH]
+    subscriptions = Subscription.objects.filter(author_id=author_id)
+    _insert_entries(subscriptions.filter(
+        author__recipes__pk__gte=Coalesce(Subquery(oldest_in_feed), 0)
+    ))
+    trim_feeds(subscriptions.values('user_id'))
+
+
+def rebuild_feeds(first_user_id, last_user_id):
+    """
+    Заново собирает ленты пользователей с id от first_user_id до
+    last_user_id: последние FEED_MAX_LENGTH рецептов каждого автора,
+    чьи рецепты раскладываются по лентам, с обрезкой ленты до
+    FEED_MAX_LENGTH.
+    """
+    FeedEntry.objects.filter(
+        user_id__gte=first_user_id, user_id__lte=last_user_id
+    ).delete()
+    oldest_in_feed = Recipe.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-pk').values('pk')[FEED_MAX_LENGTH - 1:FEED_MAX_LENGTH]
+    _insert_entries(Subscription.objects.filter(
+        user_id__gte=first_user_id, user_id__lte=last_user_id,
+        author__followers_count__lte=FEED_FANOUT_FOLLOWERS_LIMIT,
+        author__recipes__pk__gte=Coalesce(Subquery(oldest_in_feed), 0)
+    ))
+    trim_feeds(User.objects.filter(
+        pk__gte=first_user_id, pk__lte=last_user_id
+    ).values('pk'))
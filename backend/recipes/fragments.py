@@ -0,0 +1,43 @@
+from django.core.cache import cache
+
+from foodgram.constants import RECIPE_FRAGMENT_CACHE_TIMEOUT
+
+
+def _fragment_key(pk):
+    return f'recipe_fragment:{pk}'
+
+
+def get_recipe_fragments(recipes, producer):
+    """
+    Возвращает словарь id рецепта - общая для всех пользователей часть
+    его представления.
+
+    Части хранятся в кеше парами (версия, данные), где версия - поле
+    updated_at рецепта, поэтому любое изменение рецепта делает старую
+    запись недействительной. Отсутствующие и устаревшие части строит
+    функция producer: она получает список рецептов и возвращает
+    словарь id - (версия, данные).
+    """
+    keys = {recipe.pk: _fragment_key(recipe.pk) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    fragments = {}
+    missing = []
+    for recipe in recipes:
+        entry = cached.get(keys[recipe.pk])
+        if entry is not None and entry[0] == recipe.updated_at:
+            fragments[recipe.pk] = entry[1]
+        else:
+            missing.append(recipe)
+    if missing:
+        produced = producer(missing)
+        cache.set_many({
+            _fragment_key(pk): entry for pk, entry in produced.items()
+        }, RECIPE_FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(
+            (pk, payload) for pk, (version, payload) in produced.items()
+        )
+    return fragments
+
+
+def delete_recipe_fragment(pk):
+    cache.delete(_fragment_key(pk))
@@ -0,0 +1,67 @@
+from bisect import bisect_left
+from threading import Lock
+
+from .catalog import get_catalog_version
+from .models import Ingredient
+
+
+class IngredientPrefixIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный по названию (без учёта регистра) список
+    ингредиентов. Поиск по префиксу выполняется бинарным поиском,
+    затем результат дополняется совпадениями по подстроке.
+    Индекс строится лениво и перестраивается, когда меняется версия
+    справочника ингредиентов в общем кеше, поэтому изменения видят
+    все процессы приложения.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = None
+        self._entries = None
+
+    def _snapshot(self):
+        version = get_catalog_version(Ingredient)
+        with self._lock:
+            if self._version == version:
+                return self._keys, self._entries
+        entries = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit'
+            )
+        )
+        keys = [entry[0] for entry in entries]
+        with self._lock:
+            self._version, self._keys, self._entries = version, keys, entries
+        return keys, entries
+
+    def search(self, query, limit):
+        """
+        Возвращает не более limit ингредиентов: сначала начинающиеся
+        с query, затем содержащие query в середине названия.
+        """
+        keys, entries = self._snapshot()
+        query = query.casefold()
+        found = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(entries[position])
+            position += 1
+        if len(found) < limit:
+            for entry in entries:
+                if query in entry[0] and not entry[0].startswith(query):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,220 @@
+import json
+import re
+from types import SimpleNamespace
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from api.v1.filters import IngredientFilter, RecipeFilter
+from recipes.models import (Favorites, FeedEntry, Ingredient,
+                            IngredientsForRecipes, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+# таблицы, полное чтение которых (последовательное или по индексу
+# с фильтрацией строк) на больших данных недопустимо
+WATCHED_MODELS = (
+    Recipe, Favorites, ShoppingCart, IngredientsForRecipes,
+    Recipe.tags.through, Subscription, Ingredient, FeedEntry,
+    ShoppingListItem,
+)
+
+# запросы по всей таблице рецептов: порядок строк должен давать индекс,
+# сортировка выборки (временное B-дерево, узел Sort) недопустима
+INDEX_ORDERED_CHECKS = {'recipe list', 'recipe list by author', 'recipe flags'}
+
+# строка плана SQLite с полным чтением таблицы без индекса
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?: AS \w+)?$')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+def apply_filterset(filterset_class, queryset, user_id, **params):
+    """
+    Queryset, отфильтрованный тем же FilterSet, что и в API, по
+    параметрам запроса; None, если параметры не прошли проверку
+    (например, в БД нет такого тега).
+    """
+    data = QueryDict(mutable=True)
+    for key, value in params.items():
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            return None
+        data.setlist(key, values)
+    filterset = filterset_class(
+        data, queryset, request=SimpleNamespace(user=User(pk=user_id))
+    )
+    if not filterset.is_valid():
+        return None
+    return filterset.qs
+
+
+def get_checks(user_id, author_ids, tag_slugs):
+    """
+    Основные запросы API: (название, queryset или None, если проверку
+    не на чем выполнить, только для PostgreSQL)
+    """
+    def recipes(**params):
+        queryset = apply_filterset(
+            RecipeFilter, Recipe.objects.all(), user_id, **params
+        )
+        return None if queryset is None else queryset[:6]
+
+    return [
+        ('recipe list', recipes(), False),
+        ('recipe list by tags', recipes(tags=tag_slugs[:1]), False),
+        ('recipe list by all tags', recipes(
+            tags=tag_slugs, tags_match='all'
+        ), False),
+        ('recipe list by author', recipes(author=user_id), False),
+        ('recipe list is_favorited', recipes(is_favorited=1), False),
+        ('recipe list is_in_shopping_cart', recipes(
+            is_in_shopping_cart=1
+        ), False),
+        ('recipe flags', Recipe.objects.with_user_flags(
+            User(pk=user_id)
+        )[:6], False),
+        ('feed', Recipe.objects.in_feed_of(User(pk=user_id)).order_by(
+            '-pub_date', '-id'
+        )[:6], False),
+        ('subscriptions', User.objects.filter(
+            subauthor__user_id=user_id
+        )[:6], False),
+        ('subscription recipes', Recipe.objects.filter(
+            author_id__in=author_ids
+        ).order_by('author_id', 'pub_date'), False),
+        ('followers', Subscription.objects.filter(
+            author_id=user_id
+        ).values('user_id'), False),
+        ('shopping list', ShoppingListItem.objects.filter(
+            user_id=user_id
+        ).order_by('ingredient__name').values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ), False),
+        # LIKE в SQLite регистронезависим и не использует индексы
+        ('ingredient prefix', apply_filterset(
+            IngredientFilter, Ingredient.objects.all(), user_id, name='аб'
+        ), True),
+    ]
+
+
+def postgresql_plan_nodes(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    # psycopg2 сам разбирает json, но может вернуть и строку
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', []))
+        yield node
+
+
+def postgresql_seq_scans(queryset):
+    for node in postgresql_plan_nodes(queryset):
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        # полный проход по индексу с отбором строк фильтром
+        elif ('Index Scan' in node['Node Type']
+                and 'Filter' in node and 'Index Cond' not in node):
+            yield node['Relation Name']
+
+
+def sqlite_seq_scans(queryset):
+    for line in queryset.explain().splitlines():
+        match = SQLITE_SCAN.search(line.strip())
+        if match:
+            yield match.group(1)
+
+
+def postgresql_sorts(queryset):
+    return any(
+        node['Node Type'] in ('Sort', 'Incremental Sort')
+        for node in postgresql_plan_nodes(queryset)
+    )
+
+
+def sqlite_sorts(queryset):
+    return SQLITE_SORT in queryset.explain()
+
+
+class Command(BaseCommand):
+    help = ('Checks EXPLAIN plans of the main API queries and fails '
+            'if they read large tables with sequential scans or sort '
+            'the whole recipe table')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--natural', action='store_true',
+            help='не запрещать PostgreSQL последовательное чтение: '
+                 'план зависит от объёма данных (используйте после '
+                 'seed_fake_data)'
+        )
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'postgresql':
+            find_seq_scans = postgresql_seq_scans
+            has_sort = postgresql_sorts
+        elif connection.vendor == 'sqlite':
+            find_seq_scans = sqlite_seq_scans
+            has_sort = sqlite_sorts
+        else:
+            raise CommandError(
+                f'Проверка планов не поддерживает {connection.vendor}'
+            )
+        user_id = Favorites.objects.values_list(
+            'user_id', flat=True
+        ).first() or 1
+        author_ids = list(Subscription.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True)[:10]) or [user_id]
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        # в пустой таблице планировщику всё равно, как её читать
+        watched_tables = {
+            model._meta.db_table for model in WATCHED_MODELS
+            if model.objects.exists()
+        }
+        failed = []
+        with transaction.atomic():
+            if (connection.vendor == 'postgresql'
+                    and not options['natural']):
+                # без последовательного чтения план покажет,
+                # есть ли у запроса подходящий индекс
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset, postgresql_only in get_checks(
+                user_id, author_ids, tag_slugs
+            ):
+                if postgresql_only and connection.vendor != 'postgresql':
+                    continue
+                if queryset is None:
+                    self.stdout.write(self.style.WARNING(
+                        f'{name}: пропущено, в БД нет данных для фильтра'
+                    ))
+                    continue
+                if options['verbose_plans']:
+                    self.stdout.write(f'{name}:\n{queryset.explain()}\n')
+                tables = sorted(
+                    set(find_seq_scans(queryset)) & watched_tables
+                )
+                if tables:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: полное чтение {", ".join(tables)}'
+                    ))
+                elif name in INDEX_ORDERED_CHECKS and has_sort(queryset):
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: сортировка без индекса'
+                    ))
+                else:
+                    self.stdout.write(f'{name}: OK')
+        if failed:
+            raise CommandError(
+                f'Запросы без подходящих индексов: {", ".join(failed)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке!'))
@@ -0,0 +1,90 @@
+import json
+import shutil
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+
+from recipes.exchange import recipe_to_record
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Streams all recipes with their authors, tags and ingredients '
+            'to a JSON Lines file, optionally packing images into a zip '
+            'archive')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--images',
+            help='zip-архив, в который сложить картинки рецептов'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def recipe_batches(self, batch_size):
+        """
+        Рецепты пачками по возрастанию id: каждая пачка читается
+        отдельными запросами от последнего id предыдущей, поэтому
+        в памяти держится не больше batch_size рецептов.
+        """
+        last_pk = 0
+        while True:
+            batch = list(Recipe.objects.with_related().filter(
+                pk__gt=last_pk
+            ).order_by('pk')[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def pack_image(self, archive, name):
+        """Кладёт картинку в архив; False, если файла нет в хранилище"""
+        try:
+            archive.getinfo(name)
+            return True
+        except KeyError:
+            pass
+        try:
+            with default_storage.open(name, 'rb') as source, archive.open(
+                name, 'w'
+            ) as target:
+                shutil.copyfileobj(source, target)
+        except OSError:
+            return False
+        return True
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        archive = None
+        if options['images']:
+            # картинки уже сжаты, поэтому хранятся в архиве без сжатия
+            archive = zipfile.ZipFile(
+                options['images'], 'w', zipfile.ZIP_STORED
+            )
+        exported = missing_images = 0
+        try:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                for batch in self.recipe_batches(options['batch_size']):
+                    for recipe in batch:
+                        file.write(json.dumps(
+                            recipe_to_record(recipe), ensure_ascii=False
+                        ) + '\n')
+                        if (archive and recipe.image.name
+                                and not self.pack_image(
+                                    archive, recipe.image.name
+                                )):
+                            missing_images += 1
+                    exported += len(batch)
+                    self.stdout.write(f'Выгружено рецептов: {exported}')
+        finally:
+            if archive:
+                archive.close()
+        if missing_images:
+            self.stdout.write(self.style.WARNING(
+                f'Не найдено картинок: {missing_images}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты выгружены в {options["path"]}! Всего: {exported}.'
+        ))
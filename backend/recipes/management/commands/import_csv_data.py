@@ -1,30 +1,138 @@
 import csv
+import json
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.catalog import bump_catalog_version
 from recipes.models import Ingredient
 
 file_path = os.path.join(
     settings.BASE_DIR, 'recipes', 'data', 'ingredients.csv'
 )
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """
+    Построчно разбирает JSON-массив объектов или JSON Lines,
+    не загружая файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in '[], \t\r\n':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(READ_CHUNK_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        position = end
+        yield item['name'], item.get('measurement_unit', '')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_json,
+}
+
 
 class Command(BaseCommand):
-    help = "Loads data from csv"
+    help = ('Loads ingredients from csv or json in batches, '
+            'skipping already existing ones')
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=file_path)
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
 
-        with open(file_path, 'r', encoding='utf-8') as csvfile:
-            dict_reader = csv.DictReader(
-                csvfile, fieldnames=['name', 'measurement_unit']
+    def import_batch(self, batch, dry_run, seen):
+        """
+        Добавляет ещё не существующие ингредиенты пачки.
+        Возвращает кол-во ингредиентов, которые нужно было добавить.
+        """
+        batch = dict.fromkeys(
+            (name.strip(), measurement_unit.strip())
+            for name, measurement_unit in batch
+            if name.strip()
+        )
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        existing.update(seen)
+        new = [key for key in batch if key not in existing]
+        if dry_run:
+            seen.update(new)
+            return len(new)
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in new],
+                ignore_conflicts=True
             )
+        return len(new)
 
-            for row in dict_reader:
-                Ingredient.objects.get_or_create(
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit'])
-
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {file_format or path}'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        processed = planned = 0
+        seen = set()
+        # строки, добавленные другим процессом между проверкой и вставкой,
+        # bulk_create(ignore_conflicts=True) пропускает молча, поэтому
+        # добавленные считаются по изменению числа строк в таблице
+        before = Ingredient.objects.count()
+        with open(path, 'r', encoding='utf-8') as file:
+            rows = READERS[file_format](file)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                planned += self.import_batch(
+                    batch, options['dry_run'], seen
+                )
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
+        if options['dry_run']:
+            inserted = planned
+        else:
+            inserted = Ingredient.objects.count() - before
+            if inserted:
+                bump_catalog_version(Ingredient)
+        prefix = 'Проверка без записи. ' if options['dry_run'] else ''
         self.stdout.write(self.style.SUCCESS(
-            'Данные из CSV успешно импортированы!'))
+            f'{prefix}Данные из {path} успешно импортированы! '
+            f'Добавлено: {inserted}, пропущено: {processed - inserted}.'
+        ))
@@ -0,0 +1,241 @@
+import json
+import zipfile
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from recipes.catalog import bump_catalog_version
+from recipes.exchange import AUTHOR_FIELDS, TAG_FIELDS, parse_pub_date
+from recipes.feed import fan_out_recipes
+from recipes.models import Ingredient, IngredientsForRecipes, Recipe, Tag
+from recipes.search import index_recipes
+from users.models import User
+
+
+def read_records(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise CommandError(f'Строка {number}: некорректный JSON ({exc})')
+
+
+class Command(BaseCommand):
+    help = ('Loads recipes from a JSON Lines file made by export_recipes '
+            'in batches, creating missing authors, tags and ingredients '
+            'and skipping already imported recipes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--images',
+            help='zip-архив с картинками, созданный export_recipes'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_authors(self, authors):
+        """
+        Словарь email - id автора. Недостающие авторы создаются без
+        пароля; автор, чей псевдоним уже занят, не создаётся.
+        """
+        authors = {author['email']: author for author in authors}
+        found = dict(User.objects.filter(
+            email__in=authors
+        ).values_list('email', 'pk'))
+        missing = [
+            author for email, author in authors.items() if email not in found
+        ]
+        if missing:
+            password = make_password(None)
+            User.objects.bulk_create([
+                User(password=password, **{
+                    field: author[field] for field in AUTHOR_FIELDS
+                }) for author in missing
+            ], ignore_conflicts=True)
+            found.update(User.objects.filter(
+                email__in=[author['email'] for author in missing]
+            ).values_list('email', 'pk'))
+        return found
+
+    def get_tags(self, tags):
+        """Словарь слаг - id тега, недостающие теги создаются"""
+        tags = {tag['slug']: tag for tag in tags}
+        found = dict(Tag.objects.filter(
+            slug__in=tags
+        ).values_list('slug', 'pk'))
+        missing = [tag for slug, tag in tags.items() if slug not in found]
+        if missing:
+            Tag.objects.bulk_create([
+                Tag(**{field: tag[field] for field in TAG_FIELDS})
+                for tag in missing
+            ], ignore_conflicts=True)
+            found.update(Tag.objects.filter(
+                slug__in=[tag['slug'] for tag in missing]
+            ).values_list('slug', 'pk'))
+            self.changed_catalogs.add(Tag)
+        return found
+
+    def get_ingredients(self, keys):
+        """
+        Словарь (название, единица измерения) - id ингредиента,
+        недостающие ингредиенты создаются.
+        """
+        def find(names):
+            return {
+                (name, measurement_unit): pk
+                for name, measurement_unit, pk in Ingredient.objects.filter(
+                    name__in=names
+                ).values_list('name', 'measurement_unit', 'pk')
+                if (name, measurement_unit) in keys
+            }
+
+        found = find({name for name, _ in keys})
+        missing = [key for key in keys if key not in found]
+        if missing:
+            Ingredient.objects.bulk_create([
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in missing
+            ], ignore_conflicts=True)
+            found.update(find({name for name, _ in missing}))
+            self.changed_catalogs.add(Ingredient)
+        return found
+
+    def import_image(self, name):
+        """
+        Кладёт картинку из архива в хранилище, если её там ещё нет,
+        и возвращает имя файла; без архива картинка остаётся ссылкой.
+        """
+        if not name or self.archive is None:
+            return name
+        try:
+            info = self.archive.getinfo(name)
+        except KeyError:
+            return name
+        if default_storage.exists(name):
+            return name
+        with self.archive.open(info) as image:
+            return default_storage.save(name, File(image, name))
+
+    def import_batch(self, records):
+        authors = self.get_authors(record['author'] for record in records)
+        tags = self.get_tags(
+            tag for record in records for tag in record['tags']
+        )
+        ingredients = self.get_ingredients({
+            (item['name'], item['measurement_unit'])
+            for record in records for item in record['ingredients']
+        })
+        # повторный импорт того же файла не создаёт копий рецептов
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={record['name'] for record in records}
+        ).values_list('author_id', 'name', 'pub_date'))
+        recipes, new_records, pub_dates = [], [], []
+        for record in records:
+            author_id = authors.get(record['author']['email'])
+            if author_id is None:
+                self.without_author += 1
+                continue
+            pub_date = parse_pub_date(record.get('pub_date'))
+            key = (author_id, record['name'], pub_date)
+            if key in existing:
+                self.duplicates += 1
+                continue
+            existing.add(key)
+            recipes.append(Recipe(
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                author_id=author_id,
+                image=self.import_image(record.get('image')),
+            ))
+            new_records.append(record)
+            pub_dates.append(pub_date)
+        if not recipes:
+            return 0
+        recipes = Recipe.objects.bulk_create_with_pks(recipes)
+        # bulk_create проставляет pub_date текущим временем
+        dated = []
+        for recipe, pub_date in zip(recipes, pub_dates):
+            if pub_date is not None:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, record in zip(recipes, new_records)
+            for tag_id in dict.fromkeys(
+                tags[tag['slug']] for tag in record['tags']
+                if tag['slug'] in tags
+            )
+        ])
+        IngredientsForRecipes.objects.bulk_create([
+            IngredientsForRecipes(
+                recipe_id=recipe.pk,
+                ingredient_id=ingredients[
+                    (item['name'], item['measurement_unit'])
+                ],
+                amount=item['amount']
+            )
+            for recipe, record in zip(recipes, new_records)
+            for item in record['ingredients']
+            if (item['name'], item['measurement_unit']) in ingredients
+        ])
+        index_recipes(recipes)
+        fan_out_recipes([recipe.pk for recipe in recipes])
+        added = Counter(recipe.author_id for recipe in recipes)
+        by_count = {}
+        for author_id, count in added.items():
+            by_count.setdefault(count, []).append(author_id)
+        for count, author_ids in by_count.items():
+            User.objects.filter(pk__in=author_ids).update(
+                recipes_count=F('recipes_count') + count
+            )
+        return len(recipes)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        self.archive = None
+        if options['images']:
+            self.archive = zipfile.ZipFile(options['images'])
+        self.changed_catalogs = set()
+        self.without_author = self.duplicates = 0
+        processed = imported = 0
+        try:
+            with open(options['path'], 'r', encoding='utf-8') as file:
+                records = read_records(file)
+                while True:
+                    batch = list(islice(records, options['batch_size']))
+                    if not batch:
+                        break
+                    try:
+                        with transaction.atomic():
+                            imported += self.import_batch(
+                                [record for _, record in batch]
+                            )
+                    except (KeyError, TypeError, ValueError) as exc:
+                        raise CommandError(
+                            f'Строки {batch[0][0]}-{batch[-1][0]}: '
+                            f'некорректная запись рецепта ({exc!r})'
+                        )
+                    processed += len(batch)
+                    self.stdout.write(f'Обработано рецептов: {processed}')
+        finally:
+            if self.archive:
+                self.archive.close()
+        for model in self.changed_catalogs:
+            bump_catalog_version(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты из {options["path"]} импортированы! '
+            f'Добавлено: {imported}, уже были: {self.duplicates}, '
+            f'без автора: {self.without_author}.'
+        ))
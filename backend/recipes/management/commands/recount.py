@@ -0,0 +1,71 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.feed import rebuild_feeds
+from recipes.models import Favorites, Recipe, ShoppingCart
+from recipes.shopping_list import rebuild_shopping_lists
+from users.models import Subscription, User
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, {
+        'favorites_count': (Favorites, 'recipe'),
+        'in_carts_count': (ShoppingCart, 'recipe'),
+    }),
+    (User, {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Subscription, 'author'),
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = ('Recalculates denormalized counters of recipes and users '
+            'and rebuilds shopping lists and subscription feeds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counters in COUNTERS:
+            values = {
+                counter: count_of(source, field)
+                for counter, (source, field) in counters.items()
+            }
+            pks = model.objects.order_by('pk').values_list('pk', flat=True)
+            last_pk = 0
+            updated = 0
+            while True:
+                batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    updated += model.objects.filter(
+                        pk__gte=batch[0], pk__lte=batch[-1]
+                    ).update(**values)
+                last_pk = batch[-1]
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: пересчитано {updated}'
+            )
+        pks = User.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while True:
+            batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                rebuild_shopping_lists(batch[0], batch[-1])
+                rebuild_feeds(batch[0], batch[-1])
+            last_pk = batch[-1]
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны!'))
@@ -0,0 +1,209 @@
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+
+from recipes.catalog import bump_catalog_version
+from recipes.models import (Favorites, Ingredient, IngredientsForRecipes,
+                            Recipe, ShoppingCart, Tag)
+from recipes.search import index_recipes
+from users.models import Subscription, User
+
+# теги, создаваемые при пустом справочнике
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'dinner'),
+    ('Ужин', '#8775D2', 'supper'),
+)
+
+# пароль всех сгенерированных пользователей
+FAKE_PASSWORD = 'fake-password'
+
+
+class PowerLaw:
+    """
+    Выбор элементов по степенному закону: элемент с рангом r
+    выпадает с весом 1 / r ** alpha. Ранги раздаются элементам
+    в случайном порядке, поэтому популярные записи не идут подряд.
+    """
+    def __init__(self, rng, items, alpha):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choices(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+    def sample(self, k):
+        """k разных элементов (k не больше размера выборки)"""
+        result = dict.fromkeys(self.choices(k))
+        while len(result) < k:
+            result.update(dict.fromkeys(self.choices(k - len(result))))
+        return list(result)
+
+
+class Command(BaseCommand):
+    help = ('Generates a large synthetic dataset of users, recipes, '
+            'favorites, shopping carts and subscriptions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--recipes', type=int, default=200000)
+        parser.add_argument('--favorites', type=int, default=1000000)
+        parser.add_argument('--carts', type=int, default=300000)
+        parser.add_argument('--subscriptions', type=int, default=300000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='показатель степенного распределения популярности'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def progress(self, label, done, total):
+        self.stdout.write(f'{label}: {done} из {total}')
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def ensure_catalogs(self):
+        if not Ingredient.objects.exists():
+            call_command('import_csv_data', stdout=self.stdout)
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create([
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            ])
+            bump_catalog_version(Tag)
+        return (
+            list(Ingredient.objects.order_by('pk').values_list(
+                'pk', flat=True
+            )),
+            list(Tag.objects.order_by('pk').values_list('pk', flat=True)),
+        )
+
+    def create_users(self, total, prefix):
+        password = make_password(FAKE_PASSWORD)
+        for start, size in self.batches(total):
+            User.objects.bulk_create([
+                User(
+                    email=f'{prefix}{number}@example.com',
+                    username=f'{prefix}{number}',
+                    first_name='Пользователь', last_name=str(number),
+                    password=password
+                ) for number in range(start, start + size)
+            ], ignore_conflicts=True)
+            self.progress('Пользователи', start + size, total)
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(self, total, prefix, authors, ingredients, tags):
+        rng = self.rng
+        recipe_ids = []
+        for start, size in self.batches(total):
+            with transaction.atomic():
+                recipes = Recipe.objects.bulk_create_with_pks([
+                    Recipe(
+                        name=f'Рецепт {prefix}{number}',
+                        text=f'Описание рецепта {prefix}{number}',
+                        cooking_time=rng.randint(5, 180),
+                        author_id=author_id,
+                        image='recipes/images/fake.png'
+                    ) for number, author_id in zip(
+                        range(start, start + size), authors.choices(size)
+                    )
+                ])
+                Recipe.tags.through.objects.bulk_create([
+                    Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                    for recipe in recipes
+                    for tag_id in rng.sample(tags, rng.randint(1, len(tags)))
+                ])
+                IngredientsForRecipes.objects.bulk_create([
+                    IngredientsForRecipes(
+                        recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                        amount=rng.randint(1, 500)
+                    )
+                    for recipe in recipes
+                    for ingredient_id in ingredients.sample(rng.randint(
+                        self.min_ingredients, self.max_ingredients
+                    ))
+                ])
+                index_recipes(recipes)
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+            self.progress('Рецепты', start + size, total)
+        return recipe_ids
+
+    def create_relations(self, label, model, total, users, targets, field,
+                         exclude_self=False):
+        """
+        Генерирует total связей пользователь - цель, пропуская повторы
+        (и связи пользователя с самим собой при exclude_self).
+        Из-за степенного распределения повторов много, поэтому
+        выводится реальное кол-во добавленных связей.
+        """
+        before = model.objects.count()
+        for start, size in self.batches(total):
+            model.objects.bulk_create([
+                model(user_id=user_id, **{field: target_id})
+                for user_id, target_id in zip(
+                    users.choices(size), targets.choices(size)
+                ) if not exclude_self or user_id != target_id
+            ], ignore_conflicts=True)
+            self.stdout.write(
+                f'{label}: сгенерировано {start + size} из {total}'
+            )
+        self.stdout.write(
+            f'{label}: добавлено {model.objects.count() - before}'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+        if not 1 <= options['min_ingredients'] <= options['max_ingredients']:
+            raise CommandError(
+                'Нужно 1 <= --min-ingredients <= --max-ingredients'
+            )
+        self.batch_size = options['batch_size']
+        self.min_ingredients = options['min_ingredients']
+        self.max_ingredients = options['max_ingredients']
+        self.rng = random.Random(options['seed'])
+        alpha = options['alpha']
+        prefix = f'seed{options["seed"]}_'
+
+        ingredient_ids, tag_ids = self.ensure_catalogs()
+        if len(ingredient_ids) < self.max_ingredients:
+            raise CommandError('В справочнике слишком мало ингредиентов')
+        user_ids = self.create_users(options['users'], prefix)
+        if not user_ids:
+            raise CommandError('Нет пользователей для генерации данных')
+        authors = PowerLaw(self.rng, user_ids, alpha)
+        ingredients = PowerLaw(self.rng, ingredient_ids, alpha)
+        recipe_ids = self.create_recipes(
+            options['recipes'], prefix, authors, ingredients, tag_ids
+        )
+        # активность пользователей тоже распределена неравномерно
+        active_users = PowerLaw(self.rng, user_ids, alpha / 2)
+        if recipe_ids:
+            popular_recipes = PowerLaw(self.rng, recipe_ids, alpha)
+            self.create_relations(
+                'Избранное', Favorites, options['favorites'],
+                active_users, popular_recipes, 'recipe_id'
+            )
+            self.create_relations(
+                'Списки покупок', ShoppingCart, options['carts'],
+                active_users, popular_recipes, 'recipe_id'
+            )
+        self.create_relations(
+            'Подписки', Subscription, options['subscriptions'],
+            active_users, authors, 'author_id', exclude_self=True
+        )
+        call_command('recount', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Тестовые данные созданы!'))
@@ -0,0 +1,50 @@
+# flake8: noqa
+# Generated by Django 3.2.16 on 2026-10-18 05:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    IngredientsForRecipes = apps.get_model('recipes', 'IngredientsForRecipes')
+    schema_editor.execute(
+        f'INSERT INTO {ShoppingListItem._meta.db_table} '
+        f'(user_id, ingredient_id, amount) '
+        f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+        f'FROM {ShoppingCart._meta.db_table} cart '
+        f'JOIN {IngredientsForRecipes._meta.db_table} item '
+        f'ON item.recipe_id = cart.recipe_id '
+        f'GROUP BY cart.user_id, item.ingredient_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Продукт в списке покупок',
+                'verbose_name_plural': 'Продукты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# flake8: noqa
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# значения foodgram.constants на момент миграции: их последующее
+# изменение не должно менять того, что делает миграция
+FEED_MAX_LENGTH = 1000
+FEED_FANOUT_FOLLOWERS_LIMIT = 10000
+
+
+def fill_feeds(apps, schema_editor):
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    oldest_in_feed = Recipe.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-pk').values('pk')[FEED_MAX_LENGTH - 1:FEED_MAX_LENGTH]
+    sql, params = Subscription.objects.filter(
+        author__followers_count__lte=FEED_FANOUT_FOLLOWERS_LIMIT,
+        author__recipes__pk__gte=Coalesce(Subquery(oldest_in_feed), 0)
+    ).values_list(
+        'user_id', 'author__recipes__pk'
+    ).order_by().query.sql_with_params()
+    FeedEntry.objects.all().delete()
+    schema_editor.execute(
+        f'INSERT INTO {FeedEntry._meta.db_table} (user_id, recipe_id) {sql}',
+        params
+    )
+    FeedEntry.objects.filter(
+        recipe_id__lt=Subquery(
+            FeedEntry.objects.filter(
+                user_id=OuterRef('user_id')
+            ).order_by('-recipe_id').values('recipe_id')[
+                FEED_MAX_LENGTH - 1:FEED_MAX_LENGTH
+            ]
+        )
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+        ('recipes', '0010_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
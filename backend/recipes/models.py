@@ -1,13 +1,18 @@
 from colorfield.fields import ColorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Value, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from foodgram.constants import (COLOR_FIELD_SYMBOL_LIMIT, DEFAULT_COLOR,
+                                FEED_FANOUT_FOLLOWERS_LIMIT,
                                 GENERAL_FIELDS_SYMBOL_LIMIT,
                                 MAX_VALUE_FOR_AMOUNT_OR_TIME,
                                 MIN_VALUE_FOR_AMOUNT_OR_TIME,
                                 RECIPE_NAME_FIELD_SYMBOL_LIMIT)
-from users.models import User
+from users.models import CounterFieldsMixin, Subscription, User
 
 
 class Tag(models.Model):
@@ -56,12 +61,114 @@ class Ingredient(models.Model):
             models.UniqueConstraint(fields=['name', 'measurement_unit'],
                                     name='unique ingredient')
         ]
+        indexes = [
+            # поиск по началу названия (LIKE 'абв%') в PostgreSQL
+            models.Index(
+                fields=['name'], opclasses=['varchar_pattern_ops'],
+                name='ingredient_name_prefix_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для рецептов"""
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов, независимо от количества рецептов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_for_recipe',
+                queryset=IngredientsForRecipes.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def bulk_create_with_pks(self, recipes):
+        """
+        Вставляет пачку рецептов и возвращает их с первичными ключами.
+        SQLite не возвращает ключи из bulk_create, и они читаются после
+        вставки в той же транзакции: первая же запись берёт блокировку
+        базы на запись до конца транзакции, так что последние
+        len(recipes) ключей принадлежат этой пачке.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            return self.bulk_create(recipes)
+        with transaction.atomic():
+            recipes = self.bulk_create(recipes)
+            pks = list(self.order_by('-pk').values_list(
+                'pk', flat=True
+            )[:len(recipes)])
+            for recipe, pk in zip(recipes, pks[::-1]):
+                recipe.pk = pk
+        return recipes
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного и списка покупок
+        для пользователя."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorites.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                recipe=OuterRef('pk'), user=user
+            ))
+        )
+
+    def in_feed_of(self, user):
+        """
+        Рецепты ленты подписок пользователя: разложенные в его ленту
+        при публикации и рецепты популярных авторов, на которых он подписан.
+        Популярные авторы выбираются отдельным запросом: без них условие
+        не содержит OR, и план идёт от индекса ленты пользователя.
+        """
+        condition = Q(
+            pk__in=FeedEntry.objects.filter(user=user).values('recipe_id')
+        )
+        popular_author_ids = list(Subscription.objects.filter(
+            user=user, author__followers_count__gt=FEED_FANOUT_FOLLOWERS_LIMIT
+        ).values_list('author_id', flat=True))
+        if popular_author_ids:
+            condition |= Q(author_id__in=popular_author_ids)
+        return self.filter(condition)
+
+    def limited_per_author(self, author_ids, limit):
+        """
+        Возвращает не более limit первых рецептов каждого автора одним
+        запросом: через ROW_NUMBER() с разбиением по автору, а если база
+        не поддерживает оконные функции - через коррелированный подзапрос.
+        """
+        recipes = self.filter(author_id__in=author_ids)
+        if not connection.features.supports_over_clause:
+            return recipes.filter(pk__in=Subquery(
+                self.model.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).order_by('pub_date', 'pk').values('pk')[:limit]
+            ))
+        ranked = recipes.annotate(author_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').asc(), F('pk').asc()],
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.author_rank <= %s ORDER BY ranked.author_rank',
+            (*params, limit)
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов"""
     name = models.CharField(
         max_length=RECIPE_NAME_FIELD_SYMBOL_LIMIT,
@@ -96,29 +203,109 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(
         auto_now_add=True,
-        db_index=True,
         verbose_name='Дата публикации',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
         verbose_name='Автор рецепта',
+        db_index=False,
     )
     image = models.ImageField(
         upload_to='recipes/images/',
         verbose_name='Изображение',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+
+    counter_fields = ('favorites_count', 'in_carts_count')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # сортировка и курсорная пагинация по (pub_date, id)
+            models.Index(
+                fields=['pub_date', 'id'], name='recipe_pub_date_id_idx'
+            ),
+            # рецепты автора в подписках и в профиле
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class FavAndCartQuerySet(models.QuerySet):
+    """Набор запросов для избранного и списка покупок"""
+
+    def _execute_returning(self, sql, params, recipe_ids):
+        """
+        Выполняет изменение строк и возвращает id затронутых им рецептов
+        (RETURNING есть в PostgreSQL и SQLite 3.35+). В старом SQLite
+        возвращаются все recipe_ids: пока транзакция с проверкой списка
+        открыта, другой процесс не может зафиксировать запись в базу.
+        """
+        returning = connection.vendor != 'sqlite' or (
+            connection.Database.sqlite_version_info >= (3, 35)
+        )
+        with connection.cursor() as cursor:
+            if not returning:
+                cursor.execute(sql, params)
+                return recipe_ids
+            cursor.execute(f'{sql} RETURNING recipe_id', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def add_for_user(self, user_id, recipe_ids):
+        """
+        Добавляет рецепты в список пользователя, пропуская уже имеющиеся,
+        и возвращает id действительно добавленных.
+        """
+        if not recipe_ids:
+            return []
+        values = ', '.join(['(%s, %s)'] * len(recipe_ids))
+        return self._execute_returning(
+            f'INSERT INTO {self.model._meta.db_table} (user_id, recipe_id) '
+            f'VALUES {values} ON CONFLICT DO NOTHING',
+            [value for pk in recipe_ids for value in (user_id, pk)],
+            recipe_ids
+        )
+
+    def remove_for_user(self, user_id, recipe_ids):
+        """
+        Удаляет рецепты из списка пользователя и возвращает id
+        действительно удалённых (минуя delete() модели).
+        """
+        if not recipe_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        return self._execute_returning(
+            f'DELETE FROM {self.model._meta.db_table} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders})',
+            [user_id, *recipe_ids],
+            recipe_ids
+        )
+
+
 class FavAndCartTemplate(models.Model):
     """Базовая модель для избранного и списка покупок"""
     recipe = models.ForeignKey(
@@ -131,9 +318,12 @@ class FavAndCartTemplate(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
-        related_name='add_%(class)s'
+        related_name='add_%(class)s',
+        db_index=False,
     )
 
+    objects = FavAndCartQuerySet.as_manager()
+
     class Meta:
         abstract = True
         ordering = ['user', 'recipe']
@@ -142,6 +332,13 @@ class FavAndCartTemplate(models.Model):
                 fields=['recipe', 'user'], name='unique_relation_%(class)s'
             )
         ]
+        indexes = [
+            # рецепты пользователя (фильтры is_favorited и
+            # is_in_shopping_cart), заменяет индекс внешнего ключа user
+            models.Index(
+                fields=['user', 'recipe'], name='%(class)s_user_recipe_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'{self.user} добавил(а) {self.recipe}'
@@ -153,6 +350,14 @@ class ShoppingCart(FavAndCartTemplate):
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списках покупок'
 
+    def delete(self, *args, **kwargs):
+        # не сигнал post_delete: он отключил бы быстрое каскадное удаление
+        # корзин при удалении рецепта или пользователя
+        from .shopping_list import remove_from_shopping_list
+        result = super().delete(*args, **kwargs)
+        remove_from_shopping_list(self.user_id, [self.recipe_id])
+        return result
+
 
 class Favorites(FavAndCartTemplate):
     """Модель избранного для рецептов"""
@@ -174,6 +379,7 @@ class IngredientsForRecipes(models.Model):
         on_delete=models.CASCADE,
         related_name='ingredient_for_recipe',
         verbose_name='Рецепт',
+        db_index=False,
     )
     amount = models.PositiveSmallIntegerField(
         verbose_name='Количество ингредиента',
@@ -192,7 +398,98 @@ class IngredientsForRecipes(models.Model):
     class Meta:
         verbose_name = 'Количество ингредиента в рецепте',
         verbose_name_plural = 'Количество ингредиентов в рецепте'
+        indexes = [
+            # ингредиенты рецепта и сумма кол-в для списка покупок;
+            # в PostgreSQL amount читается прямо из индекса
+            models.Index(
+                fields=['recipe', 'ingredient'], include=['amount'],
+                name='recipe_ingredient_amount_idx'
+            ),
+        ]
 
     def __str__(self):
         return (f'В {self.recipe} используется {self.ingredient}'
                 f' в кол-ве {self.amount}')
+
+    def touch_recipe(self):
+        """Отмечает изменение представления рецепта (см. recipes.fragments)"""
+        Recipe.objects.filter(
+            pk=self.recipe_id
+        ).update(updated_at=timezone.now())
+
+    def delete(self, *args, **kwargs):
+        # не сигнал post_delete: он отключил бы быстрое каскадное удаление
+        # строк при удалении рецепта или ингредиента
+        from .shopping_list import change_recipe_in_shopping_lists
+        result = super().delete(*args, **kwargs)
+        self.touch_recipe()
+        change_recipe_in_shopping_lists(
+            self.recipe_id, {self.ingredient_id: -self.amount}
+        )
+        return result
+
+
+class FeedEntry(models.Model):
+    """Модель записи ленты подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель суммарного кол-ва ингредиента в списке покупок пользователя.
+    Поддерживается при изменении корзин, ингредиентов рецептов и удалении
+    рецептов (см. recipes.shopping_list) и пересчитывается командой recount.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    # не PositiveIntegerField: вычитание из рассогласованного списка
+    # не должно падать на проверке, неположительные строки удаляются
+    amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списках покупок'
+        constraints = [
+            # служит и индексом для выборки списка пользователя
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок {self.user}'
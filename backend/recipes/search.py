@@ -0,0 +1,107 @@
+from django.db import connection, connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+# конфигурация полнотекстового поиска PostgreSQL (LANGUAGE_CODE = 'ru')
+SEARCH_CONFIG = 'russian'
+
+# таблица FTS5 с названиями и описаниями рецептов для SQLite
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def has_fts_table():
+    """
+    Есть ли таблица FTS5. Ответ запоминается для открытого соединения
+    с базой, чтобы сохранение рецепта и поиск не читали схему каждый раз.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    connection.ensure_connection()
+    checked = getattr(connection, 'fts_table_checked', None)
+    if checked is None or checked[0] is not connection.connection:
+        with connection.cursor() as cursor:
+            exists = FTS_TABLE in connection.introspection.table_names(cursor)
+        checked = connection.fts_table_checked = (
+            connection.connection, exists
+        )
+    return checked[1]
+
+
+def forget_fts_table(using):
+    """Сбрасывает запомненный ответ has_fts_table (после миграций)"""
+    connections[using].__dict__.pop('fts_table_checked', None)
+
+
+def fts_match_expression(query):
+    """
+    Превращает пользовательский запрос в выражение MATCH для FTS5:
+    каждое слово ищется как префикс, служебный синтаксис экранируется.
+    """
+    terms = [
+        '"{}"*'.format(term.replace('"', '""')) for term in query.split()
+    ]
+    return ' '.join(terms)
+
+
+def search_recipes(queryset, query):
+    """
+    Оставляет рецепты, подходящие под поисковый запрос по названию
+    и описанию, и сортирует их по релевантности.
+
+    В PostgreSQL используется столбец search_vector типа tsvector
+    с GIN-индексом, в SQLite - таблица FTS5, в остальных базах -
+    поиск по вхождению подстроки.
+    """
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        # модуль требует psycopg2, поэтому импортируется только здесь
+        from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                    SearchVectorField)
+
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        document = RawSQL(
+            f'"{table}"."search_vector"', [], output_field=SearchVectorField()
+        )
+        return queryset.annotate(search_document=document).filter(
+            search_document=search_query
+        ).annotate(
+            search_rank=SearchRank(document, search_query)
+        ).order_by('-search_rank', 'pk')
+    if has_fts_table():
+        match = fts_match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,)
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 2.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,), output_field=FloatField()
+        )).order_by('-search_rank', 'pk')
+    return queryset.filter(Q(name__icontains=query) | Q(text__icontains=query))
+
+
+def index_recipes(recipes):
+    """Обновляет записи рецептов в таблице FTS5 (только для SQLite)"""
+    if not has_fts_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)',
+            [(recipe.pk, recipe.name, recipe.text) for recipe in recipes]
+        )
+
+
+def unindex_recipes(recipe_ids):
+    """Удаляет рецепты из таблицы FTS5 (только для SQLite)"""
+    if not has_fts_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in recipe_ids]
+        )
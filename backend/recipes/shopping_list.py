@@ -0,0 +1,110 @@
+from django.db import connection
+
+from .models import IngredientsForRecipes, ShoppingCart, ShoppingListItem
+
+ITEMS = ShoppingListItem._meta.db_table
+RECIPE_INGREDIENTS = IngredientsForRecipes._meta.db_table
+CARTS = ShoppingCart._meta.db_table
+
+
+def _add_amounts(select, params):
+    """
+    Прибавляет к спискам покупок строки (пользователь, ингредиент,
+    кол-во), выбранные запросом select, одной вставкой с обновлением
+    существующих строк (ON CONFLICT есть в PostgreSQL и SQLite 3.24+).
+    Запрос должен содержать WHERE: без него SQLite не разбирает
+    ON CONFLICT после SELECT.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS} (user_id, ingredient_id, amount) {select} '
+            f'ON CONFLICT (user_id, ingredient_id) '
+            f'DO UPDATE SET amount = {ITEMS}.amount + excluded.amount',
+            params
+        )
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def add_to_shopping_list(user_id, recipe_ids, sign=1):
+    """Прибавляет (или вычитает при sign=-1) ингредиенты рецептов"""
+    if not recipe_ids:
+        return
+    _add_amounts(
+        f'SELECT %s, ingredient_id, SUM(amount) * %s '
+        f'FROM {RECIPE_INGREDIENTS} '
+        f'WHERE recipe_id IN ({_placeholders(recipe_ids)}) '
+        f'GROUP BY ingredient_id',
+        [user_id, sign, *recipe_ids]
+    )
+    if sign < 0:
+        ShoppingListItem.objects.filter(
+            user_id=user_id, amount__lte=0
+        ).delete()
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    add_to_shopping_list(user_id, recipe_ids, sign=-1)
+
+
+def change_recipe_in_shopping_lists(recipe_id, deltas):
+    """
+    Применяет изменения кол-в ингредиентов рецепта {id ингредиента:
+    разница} к спискам покупок всех пользователей, добавивших рецепт.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    values = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas)
+    )
+    _add_amounts(
+        f'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+        f'FROM {CARTS} cart, ({values}) delta '
+        f'WHERE cart.recipe_id = %s',
+        [value for item in deltas.items() for value in item] + [recipe_id]
+    )
+    decreased = [pk for pk, delta in deltas.items() if delta < 0]
+    if decreased:
+        ShoppingListItem.objects.filter(
+            user_id__in=ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values('user_id'),
+            ingredient_id__in=decreased, amount__lte=0
+        ).delete()
+
+
+def remove_recipe_from_shopping_lists(recipe_id):
+    """Вычитает рецепт из всех списков покупок перед его удалением"""
+    _add_amounts(
+        f'SELECT cart.user_id, item.ingredient_id, -SUM(item.amount) '
+        f'FROM {CARTS} cart '
+        f'JOIN {RECIPE_INGREDIENTS} item ON item.recipe_id = cart.recipe_id '
+        f'WHERE cart.recipe_id = %s '
+        f'GROUP BY cart.user_id, item.ingredient_id',
+        [recipe_id]
+    )
+    ShoppingListItem.objects.filter(
+        user_id__in=ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values('user_id'),
+        amount__lte=0
+    ).delete()
+
+
+def rebuild_shopping_lists(first_user_id, last_user_id):
+    """Заново собирает из корзин списки покупок пользователей с id
+    от first_user_id до last_user_id"""
+    ShoppingListItem.objects.filter(
+        user_id__gte=first_user_id, user_id__lte=last_user_id
+    ).delete()
+    _add_amounts(
+        f'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+        f'FROM {CARTS} cart '
+        f'JOIN {RECIPE_INGREDIENTS} item ON item.recipe_id = cart.recipe_id '
+        f'WHERE cart.user_id BETWEEN %s AND %s '
+        f'GROUP BY cart.user_id, item.ingredient_id',
+        [first_user_id, last_user_id]
+    )
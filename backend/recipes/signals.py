@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscription, User
+from .catalog import bump_catalog_version
+from .feed import add_author_to_feed, fan_out_recipe, remove_author_from_feed
+from .fragments import delete_recipe_fragment
+from .models import (Ingredient, IngredientsForRecipes, Recipe, ShoppingCart,
+                     Tag)
+from .search import forget_fts_table, index_recipes, unindex_recipes
+from .shopping_list import (add_to_shopping_list,
+                            change_recipe_in_shopping_lists,
+                            remove_recipe_from_shopping_lists)
+
+# поля пользователя, входящие в представление рецепта
+USER_REPRESENTATION_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_catalog_version_on_change(sender, **kwargs):
+    bump_catalog_version(sender)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_index(instance, **kwargs):
+    index_recipes([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_search_index(instance, **kwargs):
+    unindex_recipes([instance.pk])
+
+
+@receiver(post_migrate)
+def forget_search_index_table(using, **kwargs):
+    forget_fts_table(using)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out_recipe(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def add_author_to_subscriber_feed(instance, created, **kwargs):
+    if created:
+        add_author_to_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_author_from_subscriber_feed(instance, **kwargs):
+    remove_author_from_feed(instance.user_id, instance.author_id)
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+@receiver([post_save, pre_delete], sender=Ingredient)
+def touch_catalog_recipes(sender, instance, **kwargs):
+    """Изменение справочника меняет представление связанных рецептов"""
+    lookup = 'tags' if sender is Tag else 'ingredients'
+    Recipe.objects.filter(
+        **{lookup: instance}
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not (
+        set(update_fields) & set(USER_REPRESENTATION_FIELDS)
+    ):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=IngredientsForRecipes)
+def touch_recipe_on_ingredients_change(instance, **kwargs):
+    instance.touch_recipe()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(instance, created, **kwargs):
+    if created:
+        add_to_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe_from_shopping_lists(instance, **kwargs):
+    # одним запросом на рецепт: строки корзин и ингредиентов рецепта
+    # затем удаляются каскадом без загрузки; удаление пользователя или
+    # ингредиента удаляет и их строки списков покупок
+    remove_recipe_from_shopping_lists(instance.pk)
+
+
+@receiver(pre_save, sender=IngredientsForRecipes)
+def remember_saved_ingredient(instance, **kwargs):
+    """Запоминает сохранённые ингредиент и кол-во строки, чтобы после
+    сохранения поправить списки покупок на разницу"""
+    instance._saved_ingredient = IngredientsForRecipes.objects.filter(
+        pk=instance.pk
+    ).values_list('ingredient_id', 'amount').first() if instance.pk else None
+
+
+@receiver(post_save, sender=IngredientsForRecipes)
+def change_ingredient_in_shopping_lists(instance, **kwargs):
+    deltas = {instance.ingredient_id: instance.amount}
+    saved = getattr(instance, '_saved_ingredient', None)
+    if saved is not None:
+        ingredient_id, amount = saved
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    change_recipe_in_shopping_lists(instance.recipe_id, deltas)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipes_on_tags_change(instance, action, reverse, pk_set,
+                                 **kwargs):
+    """Изменение тегов рецепта меняет его представление"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recipes = Recipe.objects.filter(pk=instance.pk)
+        else:
+            return
+    elif action in ('post_add', 'post_remove'):
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        recipes = Recipe.objects.filter(tags=instance)
+    else:
+        return
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_fragment(instance, **kwargs):
+    delete_recipe_fragment(instance.pk)
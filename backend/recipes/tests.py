@@ -0,0 +1,229 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.v1.filters import RecipeFilter
+from users.models import User
+from .models import (Ingredient, IngredientsForRecipes, Recipe, ShoppingCart,
+                     ShoppingListItem, Tag)
+from .search import has_fts_table
+
+
+class RecipeCounterFieldsTest(TestCase):
+    """Счётчики рецепта не перезаписываются обычным save()"""
+
+    def test_save_keeps_counters(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10, author=author,
+            image='recipes/images/recipe.png'
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=4, in_carts_count=7
+        )
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 4)
+        self.assertEqual(recipe.in_carts_count, 7)
+
+
+class ShoppingListSignalsTest(TestCase):
+    """Списки покупок следуют за изменениями не только через API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        self.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        self.milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл'
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                author=self.user, image='recipes/images/recipe.png'
+            ) for number in range(2)
+        ]
+        for recipe in self.recipes:
+            IngredientsForRecipes.objects.create(
+                recipe=recipe, ingredient=self.flour, amount=100
+            )
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def get_shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_cart_changes(self):
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 200})
+        ShoppingCart.objects.get(recipe=self.recipes[0]).delete()
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 100})
+
+    def test_ingredient_row_changes(self):
+        row = IngredientsForRecipes.objects.get(
+            recipe=self.recipes[0], ingredient=self.flour
+        )
+        row.amount = 150
+        row.save()
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 250})
+        row.ingredient = self.milk
+        row.save()
+        self.assertEqual(
+            self.get_shopping_list(), {self.flour.pk: 100, self.milk.pk: 150}
+        )
+        row.delete()
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 100})
+
+    def test_recipe_delete(self):
+        self.recipes[0].delete()
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 100})
+        Recipe.objects.all().delete()
+        self.assertEqual(self.get_shopping_list(), {})
+
+    def test_ingredient_delete(self):
+        IngredientsForRecipes.objects.create(
+            recipe=self.recipes[0], ingredient=self.milk, amount=30
+        )
+        self.milk.delete()
+        self.assertEqual(self.get_shopping_list(), {self.flour.pk: 200})
+
+    def test_author_delete(self):
+        other = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        ShoppingCart.objects.create(user=other, recipe=self.recipes[0])
+        self.user.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_recipe_delete_does_not_load_cascaded_rows(self):
+        """Кол-во запросов удаления рецепта не зависит от числа корзин"""
+        counts = []
+        for recipe, carts in zip(self.recipes, (1, 5)):
+            for number in range(carts):
+                ShoppingCart.objects.create(
+                    user=User.objects.create_user(
+                        email=f'{recipe.pk}-{number}@example.com',
+                        username=f'user-{recipe.pk}-{number}',
+                        first_name='Имя', last_name='Фамилия',
+                        password='pass-4815'
+                    ),
+                    recipe=recipe
+                )
+            with CaptureQueriesContext(connection) as queries:
+                recipe.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SearchIndexTableTest(TestCase):
+    """Наличие таблицы FTS5 проверяется один раз на соединение"""
+
+    def test_answer_is_remembered(self):
+        has_fts_table()
+        with self.assertNumQueries(0):
+            has_fts_table()
+
+
+class RecipeTagsFilterTest(TestCase):
+    """Фильтр по тегам совпадает с выборкой через tags__slug__in"""
+    slug_sets = (['tag-0'], ['tag-0', 'tag-1'], ['tag-1', 'tag-2', 'tag-3'])
+
+    def setUp(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='pass-4815'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag-{number}'
+            ) for number in range(4)
+        ]
+        # каждый рецепт получает свой набор тегов, большинство — несколько
+        tag_sets = ((0,), (0, 1), (0, 1, 2), (1, 2), (2, 3), (0, 1, 2, 3), ())
+        for number, tag_set in enumerate(tag_sets):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                author=author, image='recipes/images/recipe.png'
+            )
+            recipe.tags.set(tags[index] for index in tag_set)
+
+    def filter_ids(self, slugs, tags_match):
+        recipe_filter = RecipeFilter(
+            data={'tags': slugs, 'tags_match': tags_match},
+            queryset=Recipe.objects.all()
+        )
+        self.assertTrue(recipe_filter.is_valid(), recipe_filter.errors)
+        return list(recipe_filter.qs.values_list('pk', flat=True))
+
+    def test_any_matches_distinct_join(self):
+        for slugs in self.slug_sets:
+            with self.subTest(slugs=slugs):
+                expected = Recipe.objects.filter(
+                    tags__slug__in=slugs
+                ).distinct().values_list('pk', flat=True)
+                ids = self.filter_ids(slugs, 'any')
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), set(expected))
+
+    def test_all_matches_every_slug(self):
+        for slugs in self.slug_sets:
+            with self.subTest(slugs=slugs):
+                expected = Recipe.objects.filter(
+                    tags__slug__in=slugs
+                ).distinct()
+                for slug in slugs:
+                    expected = expected.filter(tags__slug=slug)
+                ids = self.filter_ids(slugs, 'all')
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(
+                    set(ids), set(expected.values_list('pk', flat=True))
+                )
+
+
+class QueryPlansTest(TestCase):
+    """Основные запросы API читают большие таблицы по индексам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_fake_data', users=30, recipes=60, favorites=200, carts=60,
+            subscriptions=100, batch_size=50, stdout=StringIO()
+        )
+
+    def check_plans(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+    def test_plans_use_indexes(self):
+        self.check_plans()
+
+    def test_seq_scan_fails(self):
+        checks = [('amount', ShoppingListItem.objects.filter(amount=1), False)]
+        with mock.patch(
+            'recipes.management.commands.check_query_plans.get_checks',
+            return_value=checks
+        ), self.assertRaises(CommandError):
+            self.check_plans()
+
+    def test_sort_fails(self):
+        recipes = Recipe.objects.filter(author_id=1).order_by('name')[:6]
+        checks = [('recipe list by author', recipes, False)]
+        with mock.patch(
+            'recipes.management.commands.check_query_plans.get_checks',
+            return_value=checks
+        ), self.assertRaises(CommandError):
+            self.check_plans()
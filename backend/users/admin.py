@@ -10,7 +10,8 @@ User = get_user_model()
 
 
 class UserAdmin(UserAdmin):
-    list_display = ('pk', 'username', 'email')
+    list_display = ('pk', 'username', 'email', 'recipes_count',
+                    'followers_count')
     search_fields = ('username', 'email')
     empty_value_display = 'N/A'
 
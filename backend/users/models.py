@@ -6,10 +6,37 @@ from django.db.models import CheckConstraint, F, Q
 from foodgram.constants import GENERAL_FIELDS_SYMBOL_LIMIT
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Исключает денормализованные счётчики из обычного save().
+
+    Счётчики меняются только запросами update с F() и командой
+    recount, а загруженный экземпляр (например, пользователь из кеша
+    токенов) может хранить их устаревшие значения. Поэтому save()
+    существующей записи сохраняет все поля, кроме счётчиков, если они
+    не перечислены в update_fields явно.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """Модель пользователя"""
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'followers_count')
 
     email = models.EmailField(
         unique=True,
@@ -33,6 +60,16 @@ class User(AbstractUser):
         max_length=GENERAL_FIELDS_SYMBOL_LIMIT,
         verbose_name='Пароль',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков',
+    )
 
     class Meta:
         ordering = ['username']
@@ -47,12 +84,14 @@ class Subscription(models.Model):
         on_delete=models.CASCADE,
         related_name='subscriber',
         verbose_name='Подписчик',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='subauthor',
         verbose_name='Автор',
+        db_index=False,
     )
 
     class Meta:
@@ -68,3 +107,10 @@ class Subscription(models.Model):
                 name='self_subscription_check'
             )
         ]
+        indexes = [
+            # подписчики автора (раскладка ленты, счётчики); подписки
+            # пользователя обслуживает индекс unique_subscription
+            models.Index(
+                fields=['author', 'user'], name='subscription_author_user_idx'
+            ),
+        ]
@@ -0,0 +1,38 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .models import User
+
+
+class CounterFieldsTest(APITestCase):
+    """Счётчики пользователя не перезаписываются обычным save()"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='old-pass-4815'
+        )
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_set_password_keeps_counters(self):
+        # пользователь попадает в кеш токенов со старыми счётчиками
+        self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(
+            recipes_count=2, followers_count=3
+        )
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-pass-4815',
+            'new_password': 'new-pass-1623',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-pass-1623'))
+        self.assertEqual(self.user.recipes_count, 2)
+        self.assertEqual(self.user.followers_count, 3)
+
+    def test_explicit_update_fields_saves_counters(self):
+        self.user.recipes_count = 5
+        self.user.save(update_fields=['recipes_count'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 5)